@@ -1,16 +1,37 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 import aiohttp
+import asyncio
+import random
+import socket
+import struct
+import heapq
+import json
+import hashlib
+import zlib
+import uuid
+import io
+import base64
+from array import array
+from typing import Optional
+from aiohttp import web
+from collections import deque
 import time
 from discord import app_commands
 import os
 import sys
 import redis
-import subprocess
+import redis.asyncio as aioredis
 from dotenv import load_dotenv
 from datetime import datetime, timezone, timedelta
 import re
 
+try:
+    from matplotlib.figure import Figure #Optional, only needed for /playergraph. pip install matplotlib
+    import matplotlib.dates as mdates
+except ImportError:
+    Figure = None
+
 
 load_dotenv()
 
@@ -25,172 +46,1832 @@ BOT_PATH = 'C:\\Users\\admin\\Downloads\\Discordbot\\Space-Engineers-Discord-Bot
 EXPRESS_SERVER_PATH = "C:\\Users\\admin\\Downloads\\Discordbot\\server.js" #Change this to the directory the javascript file is in. "server.js" dosent need to be changed unless renamed.
 
 
-redis_client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, db=REDIS_DB, decode_responses=True) #I would recommend setting up Redis since alot of the code requires it. Bot likely wont start without it.
-
-SERVER_URL = 'http://localhost:3000/players'  # URL of the Express server. If self hosted should be http://localhost:3000/players
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108')) #Local port for the Prometheus /metrics endpoint. 0 turns it off.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOOP_LAG_INTERVAL = 1 #How often (in seconds) the event loop lag is sampled.
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Counter:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    @property
+    def total(self):
+        return sum(self.values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(labels)} {value}")
+        return lines
+
+
+class Gauge:
+    #Read from a callback when scraped, so nothing has to keep it up to date.
+    def __init__(self, name, description, read):
+        self.name = name
+        self.description = description
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        if key not in self.values:
+            self.values[key] = [[0] * len(self.buckets), 0, 0, 0]
+        series = self.values[key]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += 1
+        series[2] += value
+        series[3] = max(series[3], value)
+
+    def time(self, **labels):
+        return HistogramTimer(self, labels)
+
+    def summary(self):
+        #Count, average, approximate 95th percentile and max across every label set.
+        count = sum(series[1] for series in self.values.values())
+        if not count:
+            return 0, 0, 0, 0
+        total = sum(series[2] for series in self.values.values())
+        maximum = max(series[3] for series in self.values.values())
+        p95 = maximum
+        for index, bound in enumerate(self.buckets):
+            if sum(series[0][index] for series in self.values.values()) >= count * 0.95:
+                p95 = bound
+                break
+        return count, total / count, p95, maximum
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (bucket_counts, count, total, _) in self.values.items():
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+class HistogramTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.labels.setdefault('result', 'error' if exc_type else 'ok')
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description):
+        return self._add(Counter(name, description))
+
+    def gauge(self, name, description, read):
+        return self._add(Gauge(name, description, read))
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, description, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+upstream_fetch_seconds = metrics.histogram('sebot_upstream_fetch_seconds', 'Time spent fetching a player list from a query backend.')
+redis_command_seconds = metrics.histogram('sebot_redis_command_seconds', 'Time spent on Redis commands and pipelines.')
+cache_requests_total = metrics.counter('sebot_cache_requests_total', 'Reads from the local Redis cache by result.')
+discord_send_seconds = metrics.histogram('sebot_discord_send_seconds', 'Time spent sending a notification message to Discord.')
+notifications_total = metrics.counter('sebot_notifications_total', 'Notifications queued for delivery.')
+notification_messages_total = metrics.counter('sebot_notification_messages_total', 'Batched notification messages sent to log channels by result.')
+notification_wait_seconds = metrics.histogram('sebot_notification_wait_seconds', 'How long a notification batch waited in the queue before sending.')
+presence_update_seconds = metrics.histogram('sebot_presence_update_seconds', 'Time spent updating the bot status.')
+poll_lag_seconds = metrics.histogram('sebot_poll_lag_seconds', 'How late a server check started compared to when it was due.')
+poll_duration_seconds = metrics.histogram('sebot_poll_duration_seconds', 'Time spent on one server check.')
+poll_overruns_total = metrics.counter('sebot_poll_overruns_total', 'Server checks skipped because the previous one was still running.')
+event_loop_lag_seconds = metrics.histogram('sebot_event_loop_lag_seconds', 'How late the event loop woke up a sleeping task.')
+metrics.gauge('sebot_notification_queue_depth', 'Notifications waiting to be sent.', lambda: notification_dispatcher.depth)
+metrics.gauge('sebot_notification_oldest_wait_seconds', 'Age of the oldest queued notification.', lambda: notification_dispatcher.oldest_wait)
+metrics.gauge('sebot_monitored_servers', 'Servers being monitored.', lambda: len(server_registry.servers))
+metrics.gauge('sebot_sidecar_restarts', 'Times the query sidecar has been restarted.', lambda: sidecar.restarts)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        with redis_command_seconds.time(command=str(args[0]).lower()):
+            return await super().execute_command(*args, **options)
+
+
+async def monitor_event_loop_lag():
+    #Anything that blocks the event loop shows up as this sleep waking up late.
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        event_loop_lag_seconds.observe(max(0, time.perf_counter() - start - LOOP_LAG_INTERVAL))
+
+
+class MetricsServer:
+    def __init__(self, registry, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.lag_monitor = None
+
+    async def handle_metrics(self, request):
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        if self.lag_monitor is None:
+            self.lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+        if self.runner is not None or not self.port:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, self.host, self.port).start()
+            print(f"Metrics are available at http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            print(f"Failed to start the metrics endpoint: {e}")
+
+    async def close(self):
+        if self.lag_monitor is not None:
+            self.lag_monitor.cancel()
+            self.lag_monitor = None
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+metrics_server = MetricsServer(metrics)
+
+
+REDIS_POOL_SIZE = 10
+CACHE_TTL = 60 #How long (in seconds) hot Redis keys are cached when keyspace notifications can't be enabled on the Redis server.
+CACHE_RESUBSCRIBE_DELAY = 5
+
+redis_pool = aioredis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, db=REDIS_DB, decode_responses=True, max_connections=REDIS_POOL_SIZE)
+redis_client = InstrumentedRedis(connection_pool=redis_pool) #I would recommend setting up Redis since alot of the code requires it. Bot likely wont start without it.
+
+SIDECAR_PORT = 3000 #Port server.js listens on when the bot starts it.
+SERVER_URL = f'http://localhost:{SIDECAR_PORT}/players'  # URL of the Express server. If self hosted should be http://localhost:3000/players
+SIDECAR_HEALTH_URL = f'http://localhost:{SIDECAR_PORT}/health'
+SIDECAR_STARTUP_TIMEOUT = 15 #How long (in seconds) to wait for server.js to answer its health check after starting it.
+SIDECAR_HEALTH_INTERVAL = 10
+SIDECAR_HEALTH_FAILURES = 3 #How many failed health checks in a row before server.js is restarted.
+SIDECAR_RESTART_BACKOFF_MAX = 60
+QUERY_BACKEND = os.getenv('QUERY_BACKEND', 'a2s') #"a2s" queries the game server directly, "express" uses server.js. "a2s,express" falls back to server.js when the direct query fails.
+SE_SERVER_NAME = os.getenv('SE_SERVER_NAME', 'Keen NA1') #The first server added to the monitored server list. More can be added with /serveradd.
+SE_SERVER_HOST = os.getenv('SE_SERVER_HOST', '192.169.93.178')
+SE_SERVER_PORT = int(os.getenv('SE_SERVER_PORT', '27019'))
+SE_SERVER_CAPACITY = 16 #Player slots used when a server's own count can't be read over A2S.
+POLL_CONCURRENCY = 20 #How many servers can be queried at the same time.
+A2S_TIMEOUT = 3
+A2S_MAX_RETRIES = 2
+servers_key = "servers"
+ROSTER_LEAVE_MISSES = 2 #How many checks in a row a player has to be missing from the list before they count as having left.
+ROSTER_REJOIN_TOLERANCE = 10 #If a player's time on the server drops by more than this (in seconds) they left and rejoined between two checks.
+ROSTER_SAVE_INTERVAL = 30 #How often (in seconds) online players' last seen times are saved. A crash loses at most this much playtime.
+PLAYER_COUNT_SECONDS = 3600 #How many 1 second player count samples are kept (1 hour).
+PLAYER_COUNT_MINUTES = 10080 #How many 1 minute rollups are kept (7 days).
+PLAYER_COUNT_HOURS = 8760 #How many 1 hour rollups are kept (1 year).
+PLAYER_COUNT_SAVE_INTERVAL = 300 #How often (in seconds) player count history is saved to Redis.
+SESSION_RETENTION_DAYS = 365 #How long finished sessions are kept in the time index.
+SESSION_HISTORY_PER_PLAYER = 500 #How many past sessions are kept for each player.
+presence_server_key = "presence_server"
 CHECK_INTERVAL = 2
-log_channel_key = "log_channel_id"
+PLAYER_SNAPSHOT_MAX_AGE = 2 #How old (in seconds) the player list can be before /playerlist fetches a fresh one instead of waiting for the next check.
+HTTP_CONNECT_TIMEOUT = 3
+HTTP_READ_TIMEOUT = 10 #Gamedig can be slow, but a hung query should never stall the status loops.
+HTTP_POOL_SIZE = 10
+HTTP_KEEPALIVE_TIMEOUT = 30
+HTTP_MAX_RETRIES = 2
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 5
+BREAKER_FAILURE_THRESHOLD = 3 #How many failed fetches in a row before the server is reported offline.
+BREAKER_RESET_TIMEOUT = 30 #How long (in seconds) to wait before trying the API again once it has been reported offline.
+NOTIFY_BATCH_WINDOW = 1 #How long (in seconds) to collect join/leave events before sending them as one message.
+NOTIFY_CHANNEL_INTERVAL = 1 #Minimum time (in seconds) between two messages to the same channel.
+DISCORD_MESSAGE_LIMIT = 2000
+PLAYERLIST_PAGE_SIZE = 20 #Players per /playerlist page. Discord allows at most 25 fields per embed.
+PAGINATION_TIMEOUT = 300 #How long (in seconds) the page buttons keep working.
+SUGGESTION_PAGE_SIZE = 10 #Suggestions per /showsuggestions page.
+SUGGESTION_MAX_LENGTH = 1000 #Discord embed fields hold at most 1024 characters.
+SUGGESTION_RATE_LIMIT = 3 #Each user can submit this many suggestions per SUGGESTION_RATE_PERIOD seconds.
+SUGGESTION_RATE_PERIOD = 3600
+WATCH_THROTTLE = 60 #Each user is mentioned or DMed at most once per this many seconds. DM events in between are sent together.
+WATCH_DM_MAX_LINES = 50
+PRESENCE_DEBOUNCE = 2 #How long (in seconds) to wait for more changes before updating the bot's status.
+PRESENCE_RATE_LIMIT = 5 #Discord allows this many status updates per PRESENCE_RATE_PERIOD seconds.
+PRESENCE_RATE_PERIOD = 60
+PRESENCE_REFRESH_INTERVAL = 1800 #Re-send the status this often (in seconds) even if nothing changed. 0 turns it off.
+log_channel_key = "log_channel_id" #Only read to migrate the old single guild setup.
+watches_key = "watches"
+command_tree_hash_key = "command_tree_hash" #Hash of the last synced command tree, so restarts only sync when a command changed.
+log_channels_key = "log_channels" #Hash of guild id -> log channel id for guilds logging every server. log_channels:<server> holds guilds logging one server.
 utc_minus_5 = timezone(timedelta(hours=-5)) #Change hours=x to your UTC time offset.
 
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(command_prefix='/', intents=intents)
+class SpaceEngineersBot(commands.AutoShardedBot):
+    #Background work starts once in setup_hook. on_ready runs again after every reconnect, so it only logs.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.restart_requested = False
+        self.startup_task = None
+        self._closing = False
+
+    def command_tree_hash(self):
+        commands = sorted((command.to_dict(self.tree) for command in self.tree.get_commands()), key=lambda command: (command['type'], command['name']))
+        return hashlib.sha256(json.dumps([self.application_id, commands], sort_keys=True).encode('utf-8')).hexdigest()
+
+    async def sync_commands(self):
+        tree_hash = self.command_tree_hash()
+        if await redis_client.get(command_tree_hash_key) == tree_hash:
+            print('Commands are unchanged, skipping sync.')
+            return
+        try:
+            await self.tree.sync()
+        except discord.HTTPException as e:
+            print(f"Failed to sync commands: {e}")
+            return
+        await redis_client.set(command_tree_hash_key, tree_hash)
+        print('Commands have been synced.')
+
+    async def setup_hook(self):
+        global start_time
+        start_time = datetime.now(utc_minus_5)
+        await asyncio.gather(self.sync_commands(), server_registry.load(), watch_index.load(), suggestion_store.migrate_legacy())
+        if 'express' in QUERY_BACKENDS:
+            sidecar.start()
+        await metrics_server.start()
+        redis_cache.start()
+        notification_dispatcher.start()
+        player_count_saver.start()
+        self.startup_task = asyncio.create_task(self.start_polling())
+
+    async def start_polling(self):
+        #Polling waits for the gateway so the first join/leave messages and status update have somewhere to go.
+        await self.wait_until_ready()
+        await migrate_global_log_channel()
+        if 'express' in QUERY_BACKENDS and not await sidecar.wait_until_ready():
+            print("Query sidecar isn't ready yet, starting to poll anyway.")
+        poll_scheduler.start()
+        presence_updater.start()
+
+    async def save_open_sessions(self):
+        for server in list(server_registry.servers.values()):
+            await session_store.save_open(server)
+
+    async def close(self):
+        if not self._closing:
+            self._closing = True
+            if self.startup_task is not None:
+                self.startup_task.cancel()
+            #Every step runs even if an earlier one fails, so e.g. Redis being down can't leave server.js running.
+            steps = (
+                poll_scheduler.close, self.save_open_sessions, player_count_saver.close, presence_updater.close, watch_notifier.close,
+                notification_dispatcher.close, sidecar.close, metrics_server.close, http_client.close, a2s_client.close, redis_cache.close
+            )
+            for step in steps:
+                try:
+                    result = step()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    print(f"Shutdown step {step.__qualname__} failed: {e!r}")
+        await super().close()
+        try:
+            await redis_client.aclose()
+        except (redis.RedisError, OSError) as e:
+            print(f"Failed to close the Redis connection: {e!r}")
+
+
+bot = SpaceEngineersBot(command_prefix='/', intents=intents)
 start_time = None
 
-server_was_offline = False
+class ApiUnavailable(Exception):
+    pass
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+class HttpClient:
+    #One long lived session for the whole bot so polls reuse pooled keep-alive connections.
+    def __init__(self):
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+            timeout = aiohttp.ClientTimeout(connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def get_json(self, url, params=None, retries=HTTP_MAX_RETRIES):
+        error = None
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.get(url, params=params) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    error = ApiUnavailable(f"HTTP {response.status} from {url}")
+                    if response.status < 500:
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = ApiUnavailable(f"{type(e).__name__} from {url}: {e}")
+            if attempt < retries:
+                await asyncio.sleep(backoff_delay(attempt))
+        raise error
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow_request(self):
+        if self.opened_at is None:
+            return True
+        #Half open: let a single trial request through once the reset timeout has passed.
+        return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+http_client = HttpClient()
+
+
+class RedisCache:
+    #Keeps hot keys in memory. Writes go through to Redis and reads only hit Redis after a keyspace notification or the TTL expires.
+    def __init__(self, client, ttl=CACHE_TTL, pattern=f"{log_channels_key}*"):
+        self.client = client
+        self.ttl = ttl
+        self.pattern = pattern #Only keys matching this are cached, so only their notifications are subscribed to.
+        self.notifications = False
+        self.listener = None
+        self._values = {}
+        self._expires = {}
+
+    def _fresh(self, key):
+        if key not in self._values:
+            return False
+        return self.notifications or time.monotonic() < self._expires[key]
+
+    def _store(self, key, value):
+        self._values[key] = value
+        self._expires[key] = time.monotonic() + self.ttl
+        return value
+
+    def invalidate(self, key):
+        self._values.pop(key, None)
+        self._expires.pop(key, None)
+
+    def clear(self):
+        self._values.clear()
+        self._expires.clear()
+
+    async def hgetall(self, key):
+        if not self._fresh(key):
+            cache_requests_total.inc(result='miss')
+            self._store(key, dict(await self.client.hgetall(key)))
+        else:
+            cache_requests_total.inc(result='hit')
+        return self._values[key]
 
-async def fetch_player_count():
-    async with aiohttp.ClientSession() as session:
-        async with session.get(SERVER_URL) as response:
-            if response.status == 200:
-                players = await response.json()
-                return len(players)
-            else:
-                return None
+    async def hset(self, key, field, value):
+        await self.client.hset(key, field, value)
+        if key in self._values:
+            self._values[key] = {**self._values[key], field: str(value)}
 
+    async def hdel(self, key, field):
+        await self.client.hdel(key, field)
+        if key in self._values:
+            self._values[key] = {name: value for name, value in self._values[key].items() if name != field}
 
-@tasks.loop(seconds=1)
-async def update_status():
-    player_count = await fetch_player_count()
-    if player_count is not None:
-        await bot.change_presence(
-            activity=discord.Activity(type=discord.ActivityType.watching, name=f"{player_count}/16 players online"))
+    def start(self):
+        if self.listener is None:
+            self.listener = asyncio.create_task(self.listen())
 
+    async def _enable_notifications(self):
+        #K = keyspace channel, g = generic commands like DEL, h = hash commands.
+        try:
+            config = await self.client.config_get('notify-keyspace-events')
+            flags = config.get('notify-keyspace-events', '')
+            missing = ''.join(flag for flag in 'Kgh' if flag not in flags and not (flag != 'K' and 'A' in flags))
+            if 'K' not in flags or missing:
+                await self.client.config_set('notify-keyspace-events', flags + missing)
+            return True
+        except redis.ResponseError as e:
+            print(f"Keyspace notifications unavailable, falling back to a {self.ttl}s cache TTL: {e}")
+            return False
+
+    async def listen(self):
+        while True:
+            pubsub = None
+            try:
+                if not await self._enable_notifications():
+                    return
+                pubsub = self.client.pubsub()
+                await pubsub.psubscribe(f"__keyspace@{REDIS_DB}__:{self.pattern}")
+                #Anything cached before the subscription was active may have missed an update.
+                self.clear()
+                self.notifications = True
+                async for message in pubsub.listen():
+                    if message['type'] == 'pmessage':
+                        self.invalidate(message['channel'].split(':', 1)[1])
+            except (redis.RedisError, OSError) as e:
+                print(f"Lost Redis keyspace notifications: {e}")
+            finally:
+                self.notifications = False
+                if pubsub is not None:
+                    await pubsub.aclose()
+            await asyncio.sleep(CACHE_RESUBSCRIBE_DELAY)
+
+    async def close(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+
+
+redis_cache = RedisCache(redis_client)
+
+
+class Notification:
+    def __init__(self, channel_id, text, mentions=()):
+        self.channel_id = channel_id
+        self.text = text
+        self.mentions = mentions
+        self.queued_at = time.monotonic()
+
+
+def chunk_lines(lines, limit=DISCORD_MESSAGE_LIMIT):
+    chunks = []
+    current = ''
+    for line in lines:
+        line = line[:limit]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class NotificationDispatcher:
+    #Groups notifications that arrive close together into one message per channel and sends them in the background.
+    def __init__(self, window=NOTIFY_BATCH_WINDOW, channel_interval=NOTIFY_CHANNEL_INTERVAL):
+        self.window = window
+        self.channel_interval = channel_interval
+        self.worker = None
+        self.last_batch_wait = 0
+        self._flushing = None
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self._last_send = {}
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    @property
+    def oldest_wait(self):
+        if not self._pending:
+            return 0
+        return time.monotonic() - self._pending[0].queued_at
+
+    def enqueue(self, channel_id, text, mentions=()):
+        self._pending.append(Notification(int(channel_id), text, mentions))
+        notifications_total.inc()
+        self._wakeup.set()
+
+    def start(self):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            #Shielded so close() cancelling the worker can't drop a batch that was already taken off the queue.
+            self._flushing = asyncio.ensure_future(self.flush())
+            try:
+                await asyncio.shield(self._flushing)
+            except Exception as e:
+                #Keep the worker alive, otherwise every later notification would sit in the queue forever.
+                print(f"Notification dispatcher error: {e!r}")
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch = list(self._pending)
+        self._pending.clear()
+        self.last_batch_wait = time.monotonic() - batch[0].queued_at
+        notification_wait_seconds.observe(self.last_batch_wait)
+
+        by_channel = {}
+        for notification in batch:
+            by_channel.setdefault(notification.channel_id, []).append(notification)
+        await asyncio.gather(*(self._send_to_channel(channel_id, notifications) for channel_id, notifications in by_channel.items()))
+
+        if len(batch) > 1:
+            print(f"Dispatched {len(batch)} notifications to {len(by_channel)} channel(s) after waiting {self.last_batch_wait:.2f}s. {self.depth} still queued.")
+
+    async def _send_to_channel(self, channel_id, notifications):
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            print("Log channel not found.")
+            return
+
+        #Notifications without text only add mentions to the batch.
+        lines = [notification.text for notification in notifications if notification.text]
+        mentions = list(dict.fromkeys(mention for notification in notifications for mention in notification.mentions))
+        if mentions:
+            lines.append(' '.join(f"<@{user_id}>" for user_id in mentions))
+
+        for chunk in chunk_lines(lines):
+            wait = self._last_send.get(channel_id, 0) + self.channel_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                with discord_send_seconds.time():
+                    await channel.send(chunk)
+                notification_messages_total.inc(result='ok')
+            except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                notification_messages_total.inc(result='error')
+                print(f"Failed to send notification to channel {channel_id}: {e!r}")
+            self._last_send[channel_id] = time.monotonic()
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        await self.flush()
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+class A2SError(ApiUnavailable):
+    pass
+
+
+A2S_HEADER = b'\xff\xff\xff\xff'
+A2S_SPLIT_HEADER = b'\xfe\xff\xff\xff'
+A2S_INFO_REQUEST = A2S_HEADER + b'TSource Engine Query\x00'
+A2S_PLAYER_REQUEST = A2S_HEADER + b'U'
+
+
+def read_a2s_string(data, offset):
+    end = data.index(b'\x00', offset)
+    return data[offset:end].decode('utf-8', errors='replace'), end + 1
+
+
+def parse_a2s_info(data):
+    offset = 1 #Protocol version
+    name, offset = read_a2s_string(data, offset)
+    map_name, offset = read_a2s_string(data, offset)
+    _, offset = read_a2s_string(data, offset) #Folder
+    game, offset = read_a2s_string(data, offset)
+    _, players, max_players, bots = struct.unpack_from('<hBBB', data, offset)
+    return {'name': name, 'map': map_name, 'game': game, 'players': players, 'max_players': max_players, 'bots': bots}
+
+
+def parse_a2s_players(data):
+    #Same shape as Gamedig's player list so the rest of the bot doesn't care which backend answered.
+    players = []
+    offset = 1 #Player count, unreliable past 255 players so the payload is read until it runs out.
+    while offset < len(data):
+        offset += 1 #Index
+        name, offset = read_a2s_string(data, offset)
+        score, duration = struct.unpack_from('<lf', data, offset)
+        offset += 8
+        players.append({'name': name, 'raw': {'score': score, 'time': duration}})
+    return players
+
+
+class A2SProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client.received(data, addr)
+
+    def error_received(self, exc):
+        print(f"A2S socket error: {exc}")
+
+    def connection_lost(self, exc):
+        self.client.transport = None
+
+
+class A2SClient:
+    #Steam server queries over a single shared UDP socket. Replies are routed back to the waiting query by source address.
+    def __init__(self, timeout=A2S_TIMEOUT):
+        self.timeout = timeout
+        self.transport = None
+        self._inboxes = {}
+        self._locks = {}
+        self._addresses = {}
+
+    async def _endpoint(self):
+        if self.transport is None or self.transport.is_closing():
+            loop = asyncio.get_running_loop()
+            self.transport, _ = await loop.create_datagram_endpoint(lambda: A2SProtocol(self), local_addr=('0.0.0.0', 0))
+        return self.transport
+
+    async def _resolve(self, host, port):
+        if (host, port) not in self._addresses:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            self._addresses[(host, port)] = infos[0][4][:2]
+        return self._addresses[(host, port)]
+
+    def received(self, data, addr):
+        inbox = self._inboxes.get(addr[:2])
+        if inbox is not None:
+            inbox.put_nowait(data)
+
+    async def _read_packet(self, inbox):
+        data = await asyncio.wait_for(inbox.get(), self.timeout)
+        if data[:4] == A2S_HEADER:
+            return data[4:]
+        if data[:4] == A2S_SPLIT_HEADER:
+            return await self._read_split(inbox, data)
+        raise A2SError("Malformed A2S packet")
+
+    async def _read_split(self, inbox, data):
+        parts = {}
+        while True:
+            request_id, total, number = struct.unpack_from('<LBB', data, 4)
+            if request_id & 0x80000000:
+                raise A2SError("Compressed A2S responses are not supported")
+            parts[number] = data[12:]
+            if len(parts) == total:
+                break
+            data = await asyncio.wait_for(inbox.get(), self.timeout)
+        payload = b''.join(parts[index] for index in range(total))
+        return payload[4:]
+
+    async def _request(self, host, port, build_request, initial_challenge, reply_type, parse):
+        addr = await self._resolve(host, port)
+        lock = self._locks.setdefault(addr, asyncio.Lock())
+        async with lock:
+            transport = await self._endpoint()
+            inbox = asyncio.Queue()
+            self._inboxes[addr] = inbox
+            try:
+                transport.sendto(build_request(initial_challenge), addr)
+                #The server may answer with a challenge token first, the request is then repeated with it.
+                for _ in range(3):
+                    packet = await self._read_packet(inbox)
+                    if packet[:1] == b'A':
+                        transport.sendto(build_request(packet[1:5]), addr)
+                    elif packet[:1] == reply_type:
+                        return parse(packet[1:])
+                    else:
+                        raise A2SError(f"Unexpected A2S response {packet[:1]!r} from {host}:{port}")
+                raise A2SError(f"{host}:{port} kept answering with challenges")
+            except asyncio.TimeoutError:
+                raise A2SError(f"A2S query to {host}:{port} timed out") from None
+            except (struct.error, IndexError, KeyError, ValueError) as e:
+                raise A2SError(f"Malformed A2S response from {host}:{port}: {e}") from None
+            finally:
+                del self._inboxes[addr]
 
-@bot.event
-async def on_ready():
-    await bot.tree.sync()
-    global start_time
-    start_time = datetime.now(utc_minus_5)
-    bot.node_process = subprocess.Popen(['node', EXPRESS_SERVER_PATH], cwd=os.path.dirname(EXPRESS_SERVER_PATH))
-    print(f'Logged in as {bot.user.name}')
-    print('Commands have been synced.')
-    check_server_status.start()
-    update_status.start()
+    async def query_info(self, host, port):
+        return await self._request(host, port, lambda challenge: A2S_INFO_REQUEST + challenge, b'', b'I', parse_a2s_info)
+
+    async def query_players(self, host, port):
+        return await self._request(host, port, lambda challenge: A2S_PLAYER_REQUEST + challenge, A2S_HEADER, b'D', parse_a2s_players)
 
-previous_players = set()
-player_join_times = {}
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
 
-@tasks.loop(seconds=CHECK_INTERVAL)
-async def check_server_status():
-    global previous_players
-    global server_was_offline
 
+a2s_client = A2SClient()
+
+
+async def query_capacity(host, port):
+    #Player slots from A2S_INFO, for servers added without an explicit capacity.
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(SERVER_URL) as response:
-                if response.status == 200:
-                    current_players = await response.json()
-                    current_player_names = set(player['name'] for player in current_players)
-
-                    new_players = current_player_names - previous_players
-                    for player in new_players:
-                        player_join_times[player] = datetime.now(utc_minus_5)
-                        await notify_player_joined(player)
-
-                    left_players = previous_players - current_player_names
-                    for player in left_players:
-                        join_time = player_join_times.pop(player, None)
-                        if join_time:
-                            time_spent = datetime.now(utc_minus_5) - join_time
-                            await notify_player_left(player, time_spent)
-
-                    previous_players = current_player_names
-
-                    if server_was_offline:
-                        await notify_server_online()
-                        server_was_offline = False
+        info = await a2s_client.query_info(host, port)
+    except (A2SError, OSError) as e:
+        print(f"Couldn't read the player slots of {host}:{port}, using {SE_SERVER_CAPACITY}: {e}")
+        return SE_SERVER_CAPACITY
+    return info['max_players'] or SE_SERVER_CAPACITY
+
+
+class A2SBackend:
+    name = 'a2s'
+
+    def __init__(self, server):
+        self.server = server
+
+    async def fetch_players(self):
+        for attempt in range(A2S_MAX_RETRIES + 1):
+            try:
+                return await a2s_client.query_players(self.server.host, self.server.port)
+            except (A2SError, OSError) as e:
+                error = e
+            if attempt < A2S_MAX_RETRIES:
+                await asyncio.sleep(backoff_delay(attempt))
+        raise A2SError(str(error))
+
+
+class ExpressBackend:
+    name = 'express'
+
+    def __init__(self, server, url=SERVER_URL):
+        self.server = server
+        self.url = url
+
+    async def fetch_players(self):
+        if not sidecar.ready.is_set():
+            raise ApiUnavailable("The query sidecar isn't running")
+        return await http_client.get_json(self.url, params={'host': self.server.host, 'port': self.server.port})
+
+
+class SidecarSupervisor:
+    #Runs server.js for the express backend. It is started once, health checked while it runs and restarted
+    #with backoff if it exits or stops answering.
+    def __init__(self, path=EXPRESS_SERVER_PATH, health_url=SIDECAR_HEALTH_URL):
+        self.path = path
+        self.health_url = health_url
+        self.process = None
+        self.task = None
+        self.restarts = 0
+        self.ready = asyncio.Event()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def wait_until_ready(self, timeout=SIDECAR_STARTUP_TIMEOUT):
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _spawn(self):
+        #The default server to query is passed through the environment, individual queries pass their own target.
+        env = dict(os.environ, PORT=str(SIDECAR_PORT), SE_SERVER_HOST=SE_SERVER_HOST, SE_SERVER_PORT=str(SE_SERVER_PORT))
+        self.process = await asyncio.create_subprocess_exec('node', self.path, cwd=os.path.dirname(self.path) or None, env=env)
+
+    async def _healthy(self):
+        try:
+            async with http_client.session.get(self.health_url, timeout=aiohttp.ClientTimeout(total=HTTP_CONNECT_TIMEOUT)) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def _wait_for_health(self):
+        deadline = time.monotonic() + SIDECAR_STARTUP_TIMEOUT
+        while time.monotonic() < deadline and self.process.returncode is None:
+            if await self._healthy():
+                return True
+            await asyncio.sleep(0.5)
+        return False
+
+    async def _monitor(self):
+        failures = 0
+        while True:
+            try:
+                await asyncio.wait_for(self.process.wait(), SIDECAR_HEALTH_INTERVAL)
+                print(f"Query sidecar exited with code {self.process.returncode}.")
+                return
+            except asyncio.TimeoutError:
+                pass
+            if await self._healthy():
+                failures = 0
+            else:
+                failures += 1
+                if failures >= SIDECAR_HEALTH_FAILURES:
+                    print("Query sidecar stopped answering health checks.")
+                    return
+
+    async def _stop_process(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+
+    async def run(self):
+        attempt = 0
+        while True:
+            try:
+                await self._spawn()
+                if await self._wait_for_health():
+                    print("Query sidecar is ready.")
+                    self.ready.set()
+                    attempt = 0
+                    await self._monitor()
+                else:
+                    print("Query sidecar didn't become ready in time.")
+            except OSError as e:
+                print(f"Failed to start the query sidecar: {e}")
+            self.ready.clear()
+            await self._stop_process()
+            delay = min(SIDECAR_RESTART_BACKOFF_MAX, 2 ** attempt) * random.uniform(0.5, 1)
+            attempt += 1
+            self.restarts += 1
+            print(f"Restarting the query sidecar in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.ready.clear()
+        await self._stop_process()
+
+
+sidecar = SidecarSupervisor()
+
+
+QUERY_BACKENDS = [name.strip().lower() for name in QUERY_BACKEND.split(',')]
+
+
+def build_backends(server, names=QUERY_BACKENDS):
+    backends = []
+    for name in names:
+        if name == 'a2s':
+            backends.append(A2SBackend(server))
+        elif name == 'express':
+            backends.append(ExpressBackend(server))
+        else:
+            raise ValueError(f"Unknown QUERY_BACKEND {name!r}")
+    return backends
+
+
+class PlayerSnapshot:
+    def __init__(self, players, fetched_at, version):
+        self.players = players #None when the fetch failed.
+        self.fetched_at = fetched_at
+        self.version = version
+
+    @property
+    def online(self):
+        return self.players is not None
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class PlayerPoller:
+    #Owns the latest player list. Every consumer reads from here so one Gamedig query is shared by everyone.
+    def __init__(self, backends):
+        self.backends = backends
+        self.snapshot = None
+        self.version = 0
+        self.breaker = CircuitBreaker()
+        self._inflight = None
+
+    async def get(self, max_age):
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.age <= max_age:
+            return snapshot
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        #Shielded so a cancelled waiter (e.g. a timed out interaction) doesn't cancel the fetch for everyone else.
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self):
+        try:
+            players = await self._fetch()
+            self.version += 1
+            self.snapshot = PlayerSnapshot(players, time.monotonic(), self.version)
+            return self.snapshot
+        finally:
+            self._inflight = None
+
+    async def _fetch(self):
+        if not self.breaker.allow_request():
+            return None
+        for backend in self.backends:
+            try:
+                with upstream_fetch_seconds.time(backend=backend.name):
+                    players = await backend.fetch_players()
+            except ApiUnavailable as e:
+                print(f"Error fetching players from the {backend.name} backend: {e}")
+                continue
+            self.breaker.record_success()
+            return players
+        self.breaker.record_failure()
+        return None
+
+
+
+class RosterEntry:
+    def __init__(self, entry_id, name, joined_at, last_time=0, last_seen=None):
+        self.id = entry_id
+        self.name = name
+        self.joined_at = joined_at
+        self.last_time = last_time
+        self.last_seen = last_seen if last_seen is not None else joined_at
+        self.misses = 0
+
+    def seen(self, raw_time, now):
+        self.last_time = raw_time
+        self.last_seen = now
+        self.misses = 0
+
+    def to_json(self):
+        return json.dumps({'name': self.name, 'joined_at': self.joined_at, 'last_time': self.last_time, 'last_seen': self.last_seen})
+
+    @classmethod
+    def from_json(cls, entry_id, data):
+        entry = json.loads(data)
+        return cls(entry_id, entry['name'], entry['joined_at'], entry.get('last_time', 0), entry.get('last_seen'))
+
+
+class RosterTracker:
+    #Tracks who is online by name plus their time on the server, so duplicate names stay separate and a player
+    #only counts as having left after ROSTER_LEAVE_MISSES checks without them.
+    def __init__(self, leave_misses=ROSTER_LEAVE_MISSES):
+        self.leave_misses = leave_misses
+        self.entries = {}
+        self.version = 0
+
+    def load(self, entries):
+        self.entries = dict(entries)
+        self.version += 1
+
+    def _add(self, name, raw_time, now):
+        entry = RosterEntry(uuid.uuid4().hex[:12], name, now - raw_time, raw_time, now)
+        self.entries[entry.id] = entry
+        return entry
+
+    def update(self, players, now):
+        current = {}
+        for player in players:
+            if player.get('name'):
+                current.setdefault(player['name'], []).append(player.get('raw', {}).get('time') or 0)
+        tracked = {}
+        for entry in self.entries.values():
+            tracked.setdefault(entry.name, []).append(entry)
+
+        joined = []
+        left = []
+        for name in current.keys() | tracked.keys():
+            times = sorted(current.get(name, ()), reverse=True)
+            entries = sorted(tracked.get(name, ()), key=lambda entry: entry.joined_at)
+            for entry, raw_time in zip(entries, times):
+                if raw_time and raw_time + ROSTER_REJOIN_TOLERANCE < entry.last_time:
+                    left.append(self.entries.pop(entry.id))
+                    joined.append(self._add(name, raw_time, now))
                 else:
-                    if not server_was_offline:
-                        await notify_server_offline()
-                        server_was_offline = True
-    except aiohttp.ClientError:
-        if not server_was_offline:
-            await notify_server_offline()
-            server_was_offline = True
+                    entry.seen(raw_time, now)
+            for raw_time in times[len(entries):]:
+                joined.append(self._add(name, raw_time, now))
+            for entry in entries[len(times):]:
+                entry.misses += 1
+                if entry.misses >= self.leave_misses:
+                    left.append(self.entries.pop(entry.id))
+
+        if joined or left:
+            self.version += 1
+        return joined, left
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RingSeries:
+    #Fixed size ring of (average, peak) player counts, one slot per `step` seconds. Memory use never grows.
+    def __init__(self, step, size):
+        self.step = step
+        self.size = size
+        self.averages = array('f', [-1.0]) * size #-1 marks a slot with no data.
+        self.peaks = array('H', [0]) * size
+        self.latest = None
+        self.version = 0
+
+    def add(self, timestamp, average, peak):
+        bucket = int(timestamp) // self.step
+        if self.latest is not None:
+            if bucket <= self.latest - self.size:
+                return
+            #Slots skipped since the last sample (e.g. while the bot was offline) are marked as missing.
+            for missing in range(self.latest + 1, min(bucket, self.latest + self.size + 1)):
+                self.averages[missing % self.size] = -1.0
+        self.averages[bucket % self.size] = average
+        self.peaks[bucket % self.size] = min(int(peak), 65535)
+        if self.latest is None or bucket > self.latest:
+            self.latest = bucket
+        self.version += 1
+
+    def window(self, start, end):
+        points = []
+        if self.latest is None:
+            return points
+        first = max(int(start) // self.step, self.latest - self.size + 1)
+        for bucket in range(first, min(int(end) // self.step, self.latest) + 1):
+            average = self.averages[bucket % self.size]
+            if average >= 0:
+                points.append((bucket * self.step, average, self.peaks[bucket % self.size]))
+        return points
+
+    def to_json(self):
+        return json.dumps({
+            'latest': self.latest,
+            'averages': base64.b64encode(self.averages.tobytes()).decode(),
+            'peaks': base64.b64encode(self.peaks.tobytes()).decode()
+        })
+
+    def load(self, data):
+        saved = json.loads(data)
+        averages = array('f')
+        averages.frombytes(base64.b64decode(saved['averages']))
+        peaks = array('H')
+        peaks.frombytes(base64.b64decode(saved['peaks']))
+        if len(averages) == self.size and len(peaks) == self.size:
+            self.averages, self.peaks, self.latest = averages, peaks, saved['latest']
+
+
+class PlayerCountSeries:
+    #Player count history for one server: raw samples roll up into minutes and minutes roll up into hours.
+    RINGS = ('seconds', 'minutes', 'hours')
+
+    def __init__(self):
+        self.seconds = RingSeries(1, PLAYER_COUNT_SECONDS)
+        self.minutes = RingSeries(60, PLAYER_COUNT_MINUTES)
+        self.hours = RingSeries(3600, PLAYER_COUNT_HOURS)
+        self._minute = None
+        self._minute_total = 0
+        self._minute_samples = 0
+        self._minute_peak = 0
+        self._hour = None
+        self._hour_total = 0
+        self._hour_samples = 0
+        self._hour_peak = 0
+
+    def record(self, timestamp, count):
+        self.seconds.add(timestamp, count, count)
+        minute = int(timestamp) // 60
+        if self._minute is not None and minute != self._minute:
+            self._flush_minute()
+        self._minute = minute
+        self._minute_total += count
+        self._minute_samples += 1
+        self._minute_peak = max(self._minute_peak, count)
+
+    def _flush_minute(self):
+        if self._minute_samples:
+            average = self._minute_total / self._minute_samples
+            self.minutes.add(self._minute * 60, average, self._minute_peak)
+            hour = self._minute // 60
+            if self._hour is not None and hour != self._hour:
+                self._flush_hour()
+            self._hour = hour
+            self._hour_total += average
+            self._hour_samples += 1
+            self._hour_peak = max(self._hour_peak, self._minute_peak)
+        self._minute_total = self._minute_samples = self._minute_peak = 0
+
+    def _flush_hour(self):
+        if self._hour_samples:
+            self.hours.add(self._hour * 3600, self._hour_total / self._hour_samples, self._hour_peak)
+        self._hour_total = self._hour_samples = self._hour_peak = 0
+
+    def versions(self):
+        return {name: getattr(self, name).version for name in self.RINGS}
+
+    def to_mapping(self, names=RINGS):
+        return {name: getattr(self, name).to_json() for name in names}
+
+    def load(self, mapping):
+        for name in self.RINGS:
+            if mapping.get(name):
+                getattr(self, name).load(mapping[name])
+
+
+class MonitoredServer:
+    #Config for one monitored server plus the roster state the poll loop keeps for it.
+    def __init__(self, name, host, port, capacity=SE_SERVER_CAPACITY, channel_id=None, interval=CHECK_INTERVAL):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.capacity = capacity
+        self.channel_id = channel_id
+        self.interval = interval
+        self.poller = PlayerPoller(build_backends(self))
+        self.roster = RosterTracker()
+        self.player_counts = PlayerCountSeries()
+        self.server_was_offline = False
+        self.last_snapshot_version = 0
+        self.roster_saved_at = 0
+
+    def to_json(self):
+        return json.dumps({'host': self.host, 'port': self.port, 'capacity': self.capacity, 'channel_id': self.channel_id, 'interval': self.interval})
+
+    @classmethod
+    def from_json(cls, name, data):
+        config = json.loads(data)
+        return cls(name, config['host'], config['port'], config.get('capacity', SE_SERVER_CAPACITY), config.get('channel_id'), config.get('interval', CHECK_INTERVAL))
+
+
+class SessionStore:
+    #Player sessions in Redis, indexed so the playtime commands never have to scan every session:
+    #  open_sessions:<server>             hash   roster entry id -> RosterEntry (recovered on restart)
+    #  session_history:<server>:<player>  zset   "start:end" scored by start
+    #  sessions_by_time:<server>          zset   "start:end:player" scored by end
+    #  playtime:<server>                  zset   player scored by total seconds
+    #  peak_hours:<server>                hash   hour of day -> player seconds
+    async def record(self, server, joined=(), left=()):
+        if not joined and not left:
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        for entry in joined:
+            pipe.hset(f"open_sessions:{server.name}", entry.id, entry.to_json())
+        for entry, end in left:
+            player, start = entry.name, entry.joined_at
+            history_key = f"session_history:{server.name}:{player}"
+            pipe.hdel(f"open_sessions:{server.name}", entry.id)
+            pipe.zadd(history_key, {f"{start:.0f}:{end:.0f}": start})
+            pipe.zremrangebyrank(history_key, 0, -SESSION_HISTORY_PER_PLAYER - 1)
+            pipe.zadd(f"sessions_by_time:{server.name}", {f"{start:.0f}:{end:.0f}:{player}": end})
+            pipe.zincrby(f"playtime:{server.name}", end - start, player)
+            for hour, seconds in split_by_hour(start, end).items():
+                pipe.hincrbyfloat(f"peak_hours:{server.name}", hour, seconds)
+        if left:
+            pipe.zremrangebyscore(f"sessions_by_time:{server.name}", 0, time.time() - SESSION_RETENTION_DAYS * 86400)
+        with redis_command_seconds.time(command='pipeline'):
+            await pipe.execute()
+
+    async def save_open(self, server):
+        #Only ever called from the server's own check (or after polling stopped), so it can't race a leave and
+        #write back an entry that was just removed.
+        if server.roster.entries:
+            await redis_client.hset(f"open_sessions:{server.name}", mapping={entry.id: entry.to_json() for entry in server.roster.entries.values()})
+
+    async def open_sessions(self, server):
+        sessions = await redis_client.hgetall(f"open_sessions:{server.name}")
+        return {entry_id: RosterEntry.from_json(entry_id, data) for entry_id, data in sessions.items()}
+
+    async def top_playtime(self, server, count):
+        return await redis_client.zrevrange(f"playtime:{server.name}", 0, count - 1, withscores=True)
+
+    async def player_history(self, server, player, count):
+        sessions = await redis_client.zrevrange(f"session_history:{server.name}:{player}", 0, count - 1)
+        return [tuple(float(part) for part in session.split(':')) for session in sessions]
+
+    async def peak_hours(self, server):
+        hours = await redis_client.hgetall(f"peak_hours:{server.name}")
+        return {int(hour): float(seconds) for hour, seconds in hours.items()}
+
+    async def remove(self, server):
+        await redis_client.delete(f"open_sessions:{server.name}")
+
+
+def split_by_hour(start, end):
+    #Seconds of the session spent in each hour of the day, in the bot's timezone.
+    hours = {}
+    current = start
+    while current < end:
+        moment = datetime.fromtimestamp(current, utc_minus_5)
+        next_hour = (moment.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+        chunk_end = min(next_hour, end)
+        hours[moment.hour] = hours.get(moment.hour, 0) + chunk_end - current
+        current = chunk_end
+    return hours
+
+
+session_store = SessionStore()
+
+
+class ServerRegistry:
+    def __init__(self):
+        self.servers = {}
+        self.presence_server_name = None
+
+    async def load(self):
+        configs = await redis_client.hgetall(servers_key)
+        if not configs:
+            #First start: seed the list with the server from .env.
+            server = MonitoredServer(SE_SERVER_NAME, SE_SERVER_HOST, SE_SERVER_PORT, await query_capacity(SE_SERVER_HOST, SE_SERVER_PORT))
+            await self.save(server)
+            configs = {server.name: server.to_json()}
+        for name, data in configs.items():
+            server = MonitoredServer.from_json(name, data)
+            await self.recover_sessions(server)
+            server.player_counts.load(await redis_client.hgetall(f"player_counts:{name}"))
+            self.servers[name] = server
+        self.presence_server_name = await redis_client.get(presence_server_key)
+
+    async def recover_sessions(self, server):
+        #Players that were online when the bot stopped keep their original join time instead of rejoining.
+        server.roster.load(await session_store.open_sessions(server))
+
+    async def save(self, server):
+        await redis_client.hset(servers_key, server.name, server.to_json())
+        self.servers[server.name] = server
+        poll_scheduler.wakeup()
+
+    async def remove(self, name):
+        await redis_client.hdel(servers_key, name)
+        server = self.servers.pop(name, None)
+        if server is not None:
+            await session_store.remove(server)
+            await redis_client.delete(f"player_counts:{name}")
+        return server
+
+    async def set_presence_server(self, name):
+        await redis_client.set(presence_server_key, name)
+        self.presence_server_name = name
+
+    def get(self, name=None):
+        if name is None:
+            return self.presence_server
+        return self.servers.get(name)
+
+    @property
+    def presence_server(self):
+        if self.presence_server_name in self.servers:
+            return self.servers[self.presence_server_name]
+        return next(iter(self.servers.values()), None)
+
+
+server_registry = ServerRegistry()
+
+
+class PlayerCountSaver:
+    def __init__(self, registry, interval=PLAYER_COUNT_SAVE_INTERVAL):
+        self.registry = registry
+        self.interval = interval
+        self.task = None
+        self._saved = {} #Server name -> (series, ring versions) as of the last successful save.
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def save(self):
+        #Only rings that changed since the last save are written. The hours ring changes once an hour, so
+        #re-encoding it every interval was wasted work.
+        pipe = redis_client.pipeline(transaction=False)
+        saved = {}
+        for server in list(self.registry.servers.values()):
+            series = server.player_counts
+            versions = series.versions()
+            last_series, last_versions = self._saved.get(server.name, (None, {}))
+            if last_series is not series:
+                last_versions = {} #A removed and re-added server starts a new series.
+            changed = [name for name, version in versions.items() if version != last_versions.get(name, 0)]
+            if changed:
+                pipe.hset(f"player_counts:{server.name}", mapping=series.to_mapping(changed))
+            saved[server.name] = (series, versions)
+        if len(pipe):
+            with redis_command_seconds.time(command='pipeline'):
+                await pipe.execute()
+        self._saved = saved
+
+    async def try_save(self):
+        try:
+            await self.save()
+        except redis.RedisError as e:
+            print(f"Failed to save player count history: {e}")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.try_save()
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            await self.try_save()
+
+
+player_count_saver = PlayerCountSaver(server_registry)
+
+
+class PollScheduler:
+    #Polls every registered server on its own interval from one task. Servers get a fixed offset inside their
+    #interval so they don't all fire at once, and at most POLL_CONCURRENCY polls run at the same time.
+    def __init__(self, registry, concurrency=POLL_CONCURRENCY):
+        self.registry = registry
+        self.concurrency = concurrency
+        self.task = None
+        self._semaphore = None
+        self._queue = []
+        self._scheduled = set()
+        self._running = {}
+        self._changed = asyncio.Event()
+
+    def start(self):
+        if self.task is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self.task = asyncio.create_task(self.run())
+
+    def wakeup(self):
+        self._changed.set()
+
+    def _schedule_new_servers(self):
+        now = time.monotonic()
+        for name, server in self.registry.servers.items():
+            if name not in self._scheduled:
+                offset = (zlib.crc32(name.encode()) % 1000) / 1000 * server.interval
+                heapq.heappush(self._queue, (now + offset, name))
+                self._scheduled.add(name)
+
+    async def run(self):
+        while True:
+            self._changed.clear()
+            self._schedule_new_servers()
+            now = time.monotonic()
+            while self._queue and self._queue[0][0] <= now:
+                due, name = heapq.heappop(self._queue)
+                server = self.registry.servers.get(name)
+                if server is None:
+                    self._scheduled.discard(name)
+                    continue
+                #A poll that overran its interval is left to finish instead of stacking another one behind it.
+                if name not in self._running:
+                    self._running[name] = asyncio.create_task(self._poll(server, due))
+                else:
+                    poll_overruns_total.inc()
+                heapq.heappush(self._queue, (max(due + server.interval, now), name))
+            timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, server, due):
+        try:
+            async with self._semaphore:
+                poll_lag_seconds.observe(max(0, time.monotonic() - due))
+                with poll_duration_seconds.time():
+                    await check_server_status(server)
+        except Exception as e:
+            print(f"Error checking {server.name}: {e}")
+        finally:
+            self._running.pop(server.name, None)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for task in list(self._running.values()):
+            task.cancel()
+
+
+poll_scheduler = PollScheduler(server_registry)
+
+class PresenceUpdater:
+    #Only updates the bot's status when what it shows actually changes. Bursts of changes are merged into one
+    #update and updates are kept under Discord's presence rate limit.
+    def __init__(self, debounce=PRESENCE_DEBOUNCE, rate_limit=PRESENCE_RATE_LIMIT, rate_period=PRESENCE_RATE_PERIOD, refresh_interval=PRESENCE_REFRESH_INTERVAL):
+        self.debounce = debounce
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.refresh_interval = refresh_interval
+        self.desired = None
+        self.current = None
+        self.task = None
+        self._sent = deque()
+        self._changed = asyncio.Event()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        self.refresh()
+
+    def describe(self, server):
+        if server is None:
+            return discord.Status.idle, "No servers are being monitored"
+        if server.poller.snapshot is None:
+            return discord.Status.idle, f"Checking {server.name}..."
+        if server.server_was_offline:
+            return discord.Status.dnd, f"{server.name} offline"
+        if len(server_registry.servers) > 1:
+            return discord.Status.online, f"{len(server.roster)}/{server.capacity} players on {server.name}"
+        return discord.Status.online, f"{len(server.roster)}/{server.capacity} players online"
+
+    def refresh(self):
+        desired = self.describe(server_registry.presence_server)
+        if desired != self.desired:
+            self.desired = desired
+            self._changed.set()
+
+    async def _wait_for_rate_limit(self):
+        while True:
+            now = time.monotonic()
+            while self._sent and now - self._sent[0] >= self.rate_period:
+                self._sent.popleft()
+            if len(self._sent) < self.rate_limit:
+                return
+            await asyncio.sleep(self._sent[0] + self.rate_period - now)
+
+    async def run(self):
+        last_update = time.monotonic()
+        while True:
+            timeout = None
+            if self.refresh_interval:
+                timeout = max(0, last_update + self.refresh_interval - time.monotonic())
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                self.current = None
+            self._changed.clear()
+            if self.desired is None or self.desired == self.current:
+                continue
+
+            await self._wait_for_rate_limit()
+            desired = self.desired
+            status, text = desired
+            try:
+                with presence_update_seconds.time():
+                    await bot.change_presence(status=status, activity=discord.Activity(type=discord.ActivityType.watching, name=text))
+                self.current = desired
+            except (discord.ClientException, discord.HTTPException, ConnectionError) as e:
+                #ConnectionClosed while a shard reconnects. Try again after the debounce.
+                print(f"Failed to update the bot's status: {e!r}")
+                self._changed.set()
+            self._sent.append(time.monotonic())
+            last_update = time.monotonic()
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+presence_updater = PresenceUpdater()
+
+
+@bot.event
+async def on_ready():
+    print(f'Logged in as {bot.user.name}')
 
 
-async def notify_player_joined(player_name):
+async def check_server_status(server, max_age=None):
+    #Only reuse a snapshot someone else fetched within the last half interval, otherwise every other tick would see a cached one.
+    snapshot = await server.poller.get(max_age=server.interval / 2 if max_age is None else max_age)
+    if snapshot.version == server.last_snapshot_version:
+        return
+    server.last_snapshot_version = snapshot.version
+
+    if snapshot.online:
+        now = time.time()
+        joined, left = server.roster.update(snapshot.players, now)
+        server.player_counts.record(now, len(server.roster))
+
+        for entry in joined:
+            await notify_player_joined(server, entry.name)
+
+        for entry in left:
+            await notify_player_left(server, entry.name, timedelta(seconds=entry.last_seen - entry.joined_at))
+
+        await session_store.record(server, joined, [(entry, entry.last_seen) for entry in left])
+        if now - server.roster_saved_at >= ROSTER_SAVE_INTERVAL:
+            await session_store.save_open(server)
+            server.roster_saved_at = now
+
+        if server.server_was_offline:
+            await notify_server_online(server)
+            server.server_was_offline = False
+    elif server.poller.breaker.is_open and not server.server_was_offline:
+        await notify_server_offline(server)
+        server.server_was_offline = True
+
+    if server is server_registry.presence_server:
+        presence_updater.refresh()
+
+
+async def server_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in server_registry.servers
+        if current.lower() in name.lower()
+    ][:25]
+
+def server_log_channels_key(server_name):
+    return f"{log_channels_key}:{server_name}"
+
+async def get_log_destinations(server):
+    #Guild id -> channel id for every guild that logs this server. A guild's server specific channel wins over its
+    #every-server channel, and a channel given to /serveradd wins over both for its own guild.
+    destinations = dict(await redis_cache.hgetall(log_channels_key))
+    destinations.update(await redis_cache.hgetall(server_log_channels_key(server.name)))
+    if server.channel_id:
+        channel = bot.get_channel(int(server.channel_id))
+        if channel is not None and getattr(channel, 'guild', None) is not None:
+            destinations[str(channel.guild.id)] = server.channel_id
+    return destinations
+
+async def notify_guilds(server, text):
+    destinations = await get_log_destinations(server)
+    if not destinations:
+        print("Log channel has not been set.")
+        return
+    for channel_id in destinations.values():
+        notification_dispatcher.enqueue(channel_id, text)
+
+WATCH_EVENTS = {
+    'join': "a player joins",
+    'leave': "a player leaves",
+    'online': "the server comes back online",
+    'offline': "the server goes offline",
+}
+
+class Watch:
+    #One user's subscription. server and player are '*' when the watch covers every server or every player.
+    def __init__(self, user_id, event, server='*', player='*', delivery='mention', guild_id=None):
+        self.user_id = str(user_id)
+        self.event = event
+        self.server = server
+        self.player = player
+        self.delivery = delivery
+        self.guild_id = str(guild_id) if guild_id else None
+
+    @property
+    def id(self):
+        return f"{self.user_id}:{self.guild_id or 'dm'}:{self.event}:{self.server}:{self.player.lower()}"
+
+    def describe(self):
+        target = "any player" if self.player == '*' else f"**{self.player}**"
+        server = "any server" if self.server == '*' else f"**{self.server}**"
+        if self.event in ('join', 'leave'):
+            what = f"{target} {'joins' if self.event == 'join' else 'leaves'} {server}"
+        else:
+            what = f"{server} {'comes back online' if self.event == 'online' else 'goes offline'}"
+        return f"{what} ({'DM' if self.delivery == 'dm' else 'mention'})"
+
+    def to_json(self):
+        return json.dumps({'user_id': self.user_id, 'event': self.event, 'server': self.server, 'player': self.player, 'delivery': self.delivery, 'guild_id': self.guild_id})
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**json.loads(data))
+
+
+class WatchIndex:
+    #Every watch lives in one Redis hash and is indexed in memory by (server, event, player), so matching a
+    #roster change is a few dict lookups per changed player no matter how many watches exist.
+    def __init__(self):
+        self.watches = {}
+        self.by_target = {}
+
+    def _index(self, watch):
+        self.watches[watch.id] = watch
+        self.by_target.setdefault((watch.server, watch.event, watch.player.lower()), set()).add(watch.id)
+
+    async def load(self):
+        for data in (await redis_client.hgetall(watches_key)).values():
+            self._index(Watch.from_json(data))
+
+    async def add(self, watch):
+        await redis_client.hset(watches_key, watch.id, watch.to_json())
+        self._index(watch)
+
+    async def remove(self, watch_id):
+        watch = self.watches.pop(watch_id, None)
+        if watch is None:
+            return None
+        await redis_client.hdel(watches_key, watch_id)
+        target = (watch.server, watch.event, watch.player.lower())
+        self.by_target[target].discard(watch_id)
+        if not self.by_target[target]:
+            del self.by_target[target]
+        return watch
+
+    def for_user(self, user_id):
+        return [watch for watch in self.watches.values() if watch.user_id == str(user_id)]
+
+    def match(self, server_name, event, player=None):
+        watch_ids = set()
+        for server in (server_name, '*'):
+            watch_ids.update(self.by_target.get((server, event, '*'), ()))
+            if player:
+                watch_ids.update(self.by_target.get((server, event, player.lower()), ()))
+        return [self.watches[watch_id] for watch_id in watch_ids]
+
+
+watch_index = WatchIndex()
+
+
+class WatchNotifier:
+    #Delivers matched watches. Mentions ride along with the log message in the guild's log channel, DMs are
+    #collected per user. Both are throttled per user so a popular player can't cause a mention storm.
+    def __init__(self, throttle=WATCH_THROTTLE):
+        self.throttle = throttle
+        self._last_mention = {}
+        self._last_dm = {}
+        self._dm_pending = {}
+        self._dm_tasks = {}
+
+    async def notify(self, server, event, text, player=None):
+        watches = watch_index.match(server.name, event, player)
+        if not watches:
+            return
+        destinations = None
+        now = time.monotonic()
+        for watch in watches:
+            if watch.delivery == 'dm':
+                self._queue_dm(watch.user_id, text)
+                continue
+            if destinations is None:
+                destinations = await get_log_destinations(server)
+            channel_id = destinations.get(watch.guild_id)
+            key = (watch.user_id, watch.guild_id)
+            if channel_id and now - self._last_mention.get(key, -self.throttle) >= self.throttle:
+                self._last_mention[key] = now
+                notification_dispatcher.enqueue(channel_id, '', (watch.user_id,))
+
+    def _queue_dm(self, user_id, text):
+        self._dm_pending.setdefault(user_id, []).append(text)
+        if user_id not in self._dm_tasks:
+            delay = max(NOTIFY_BATCH_WINDOW, self._last_dm.get(user_id, -self.throttle) + self.throttle - time.monotonic())
+            self._dm_tasks[user_id] = asyncio.create_task(self._send_dm(user_id, delay))
+
+    async def _send_dm(self, user_id, delay):
+        try:
+            await asyncio.sleep(delay)
+            lines = list(dict.fromkeys(self._dm_pending.pop(user_id, [])))
+            if len(lines) > WATCH_DM_MAX_LINES:
+                lines = lines[:WATCH_DM_MAX_LINES] + [f"...and {len(lines) - WATCH_DM_MAX_LINES} more."]
+            self._last_dm[user_id] = time.monotonic()
+            user = bot.get_user(int(user_id)) or await bot.fetch_user(int(user_id))
+            for chunk in chunk_lines(lines):
+                with discord_send_seconds.time():
+                    await user.send(chunk)
+        except discord.HTTPException as e:
+            print(f"Failed to DM watch notifications to {user_id}: {e}")
+        finally:
+            self._dm_tasks.pop(user_id, None)
+
+    async def close(self):
+        for task in list(self._dm_tasks.values()):
+            task.cancel()
+        self._dm_tasks.clear()
+
+
+watch_notifier = WatchNotifier()
+
+async def notify_player_joined(server, player_name):
     if not player_name:
         print("Player name is missing. Ignoring this event.")
         return
-    log_channel_id = await get_log_channel_id()
-    if log_channel_id:
-        channel = bot.get_channel(int(log_channel_id))
-        if channel:
-            await channel.send(f"Player **{player_name}** has joined the server at {datetime.now(utc_minus_5).strftime('%H:%M:%S UTC')}.")
-        else:
-            print("Log channel not found.")
-    else:
-        print("Log channel has not been set.")
+    text = f"Player **{player_name}** has joined **{server.name}** at {datetime.now(utc_minus_5).strftime('%H:%M:%S UTC')}."
+    await notify_guilds(server, text)
+    await watch_notifier.notify(server, 'join', text, player_name)
 
-async def notify_player_left(player_name, time_spent):
+async def notify_player_left(server, player_name, time_spent):
     if not player_name:
         print("Player name is missing. Ignoring this event.")
         return
-    log_channel_id = await get_log_channel_id()
-    notifications_key = "leave_notifications"    
-    if log_channel_id:
-        channel = bot.get_channel(int(log_channel_id))
-        if channel:
-            hours, remainder = divmod(time_spent.total_seconds(), 3600)
-            minutes, seconds = divmod(remainder, 60)
-            time_spent_str = f"{int(hours)} hour{'s' if hours != 1 else ''}, {int(minutes)} minute{'s' if minutes != 1 else ''}, and {int(seconds)} second{'s' if seconds != 1 else ''}"
-
-            subscribed_user_ids = redis_client.smembers(notifications_key)
-            if subscribed_user_ids:
-                mentions = ' '.join([f"<@{user_id}>" for user_id in subscribed_user_ids])
-                await channel.send(f"Player **{player_name}** has left the server after {time_spent_str}. {mentions}")
-            else:
-                await channel.send(f"Player **{player_name}** has left the server after {time_spent_str}.")
-        else:
-            print("Log channel not found.")
-    else:
-        print("Log channel has not been set.")
+    hours, remainder = divmod(time_spent.total_seconds(), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    time_spent_str = f"{int(hours)} hour{'s' if hours != 1 else ''}, {int(minutes)} minute{'s' if minutes != 1 else ''}, and {int(seconds)} second{'s' if seconds != 1 else ''}"
 
+    text = f"Player **{player_name}** has left **{server.name}** after {time_spent_str}."
+    await notify_guilds(server, text)
+    await watch_notifier.notify(server, 'leave', text, player_name)
 
 
-@bot.tree.command(name="setlogchannel", description="Set the log channel for server status updates")
-async def setlogchannel(interaction: discord.Interaction, channel: discord.TextChannel):
-    if interaction.user.id == allowed_user_id:
-        await set_log_channel_id(channel.id)
-        await interaction.response.send_message(f"Log channel has been set to {channel.mention}.")
-    else:
-        await interaction.response.send_message("You don't have permission to set the logs channel.")
 
-async def set_log_channel_id(channel_id):
-    redis_client.set('log_channel_id', channel_id)
+def can_manage_guild(interaction: discord.Interaction):
+    return interaction.user.id == allowed_user_id or interaction.permissions.manage_guild
 
-async def get_log_channel_id():
-    return redis_client.get('log_channel_id')
+@bot.tree.command(name="setlogchannel", description="Set this server's log channel for join/leave and status updates")
+@app_commands.describe(channel="The channel to log to", server="Only log this monitored server. Leave empty to log every server.")
+@app_commands.autocomplete(server=server_autocomplete)
+@app_commands.guild_only()
+async def setlogchannel(interaction: discord.Interaction, channel: discord.TextChannel, server: Optional[str] = None):
+    if not can_manage_guild(interaction):
+        await interaction.response.send_message("You don't have permission to set the logs channel.")
+        return
+    if server is not None and server not in server_registry.servers:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+        return
 
-async def notify_server_offline():
-    print("Error: API is offline or the server is restarting.")
-    log_channel_id = await get_log_channel_id()
-    if log_channel_id:
-        channel = bot.get_channel(int(log_channel_id))
-        if channel:
-            await channel.send(
-                "Error: API is offline or the server is restarting. Please notify <@617462103938302098> if the API is down."
-            )
-        else:
-            print("Log channel not found.")
+    key = server_log_channels_key(server) if server else log_channels_key
+    await redis_cache.hset(key, str(interaction.guild_id), channel.id)
+    if server:
+        await interaction.response.send_message(f"Log channel for {server} has been set to {channel.mention}.")
     else:
-        print("Log channel has not been set.")
+        await interaction.response.send_message(f"Log channel has been set to {channel.mention}.")
 
-async def notify_server_online():
-    log_channel_id = await get_log_channel_id()
-    if log_channel_id:
-        channel = bot.get_channel(int(log_channel_id))
-        if channel:
-            await channel.send(
-                "Connection to the server reestablished. The API is back online!"
-            )
-        else:
-            print("Log channel not found.")
-    else:
-        print("Log channel has not been set.")
+@bot.tree.command(name="removelogchannel", description="Stop logging to this server's log channel")
+@app_commands.describe(server="The monitored server to stop logging. Leave empty to remove the every-server log channel.")
+@app_commands.autocomplete(server=server_autocomplete)
+@app_commands.guild_only()
+async def removelogchannel(interaction: discord.Interaction, server: Optional[str] = None):
+    if not can_manage_guild(interaction):
+        await interaction.response.send_message("You don't have permission to remove the logs channel.")
+        return
+
+    key = server_log_channels_key(server) if server else log_channels_key
+    await redis_cache.hdel(key, str(interaction.guild_id))
+    await interaction.response.send_message("Log channel has been removed.")
+
+@bot.event
+async def on_guild_remove(guild):
+    await redis_cache.hdel(log_channels_key, str(guild.id))
+    for name in list(server_registry.servers): #/serverremove can run while this awaits.
+        await redis_cache.hdel(server_log_channels_key(name), str(guild.id))
+
+async def migrate_global_log_channel():
+    #Older versions had one log channel and one subscriber list for the whole bot.
+    legacy_channel_id = await redis_client.get(log_channel_key)
+    if not legacy_channel_id:
+        return
+    channel = bot.get_channel(int(legacy_channel_id))
+    if channel is None or getattr(channel, 'guild', None) is None:
+        return
+    guild_id = str(channel.guild.id)
+    await redis_cache.hset(log_channels_key, guild_id, legacy_channel_id)
+    for user_id in await redis_client.smembers("leave_notifications"):
+        await watch_index.add(Watch(user_id, 'leave', guild_id=guild_id))
+    await redis_client.delete(log_channel_key, "leave_notifications")
+    print(f"Moved the log channel and leave subscriptions to guild {guild_id}.")
+
+async def notify_server_offline(server):
+    print(f"Error: API is offline or {server.name} is restarting.")
+    text = f"Error: API is offline or **{server.name}** is restarting. Please notify <@617462103938302098> if the API is down."
+    await notify_guilds(server, text)
+    await watch_notifier.notify(server, 'offline', text)
+
+async def notify_server_online(server):
+    text = f"Connection to **{server.name}** reestablished. The API is back online!"
+    await notify_guilds(server, text)
+    await watch_notifier.notify(server, 'online', text)
 
 def seconds_to_hours_and_minutes(seconds):
     hours, remainder = divmod(int(seconds), 3600)  
@@ -200,46 +1881,264 @@ def seconds_to_hours_and_minutes(seconds):
     else:
         return f"{minutes} minute{'s' if minutes != 1 else ''}"
 
-@bot.tree.command(name='playerlist', description='Get the current players on Keen NA1!')
-@app_commands.allowed_installs(guilds=True, users=True)
-async def playerlist(interaction: discord.Interaction):
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(SERVER_URL) as response:
-                if response.status == 200:
-                    players = await response.json()
-                    player_count = len(players)
-
-                    if players:
-                        embed = discord.Embed(
-                            title=f"Current Players on the Server ({player_count}/16)",
-                            description="Here are the players currently online, sorted by playtime:",
-                            color=discord.Color.green()
-                        )
-
-                        for player in players:
-                            playtime_seconds = player['raw'].get('time', 0)
-                            playtime = seconds_to_hours_and_minutes(playtime_seconds)
-
-                            embed.add_field(
-                                name=player['name'],
-                                value=f"Playtime: {playtime}",
-                                inline=False
-                            )
-
-                        await interaction.response.send_message(embed=embed)
-                    else:
-                        await interaction.response.send_message('No players are currently online.')
-                else:
-                    await interaction.response.send_message(
-                        "Error: cannot fetch player list, please notify <@617462103938302098> that the API is down.",
-                        ephemeral=True
-                    )
-        except aiohttp.ClientError:
-            await interaction.response.send_message(
-                "Error: cannot fetch player list, please notify <@617462103938302098> that the API is down.",
-                ephemeral=True
+class PaginatorView(discord.ui.View):
+    def __init__(self, pages):
+        super().__init__(timeout=PAGINATION_TIMEOUT)
+        self.pages = pages
+        self.page = 0
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= len(self.pages) - 1
+
+    async def _show(self, interaction: discord.Interaction, page):
+        self.page = page
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.pages[self.page], view=self)
+
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page + 1)
+
+
+class LazyPaginatorView(PaginatorView):
+    #Fetches the next page only when Next is pressed. fetch(cursor) returns (embed, next_cursor), next_cursor is None on the last page.
+    #Only user_id can turn pages, since every press runs a fetch.
+    def __init__(self, first_page, next_cursor, fetch, user_id):
+        self.next_cursor = next_cursor
+        self.fetch = fetch
+        self.user_id = user_id
+        super().__init__([first_page])
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Only the person who ran this command can change pages.", ephemeral=True)
+            return False
+        return True
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= len(self.pages) - 1 and self.next_cursor is None
+
+    async def _show(self, interaction: discord.Interaction, page):
+        if page == len(self.pages):
+            embed, self.next_cursor = await self.fetch(self.next_cursor)
+            self.pages.append(embed)
+        await super()._show(interaction, page)
+
+
+async def send_pages(interaction: discord.Interaction, pages, **kwargs):
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+    if len(pages) > 1:
+        await send(embed=pages[0], view=PaginatorView(pages), **kwargs)
+    else:
+        await send(embed=pages[0], **kwargs)
+
+
+playerlist_cache = {}
+
+def render_player_pages(server):
+    #Pages are rendered once per roster change. Playtime is shown as a Discord timestamp so the cached
+    #pages stay correct without being re-rendered every check.
+    roster = server.roster
+    cached = playerlist_cache.get(server.name)
+    if cached and cached[0] is roster and cached[1] == (roster.version, server.capacity):
+        return cached[2]
+
+    entries = sorted(roster.entries.values(), key=lambda entry: entry.joined_at)
+    page_count = (len(entries) + PLAYERLIST_PAGE_SIZE - 1) // PLAYERLIST_PAGE_SIZE
+    pages = []
+    for page, start in enumerate(range(0, len(entries), PLAYERLIST_PAGE_SIZE), 1):
+        embed = discord.Embed(
+            title=f"Current Players on {server.name} ({len(entries)}/{server.capacity})",
+            description="Here are the players currently online, sorted by playtime:",
+            color=discord.Color.green()
+        )
+        for entry in entries[start:start + PLAYERLIST_PAGE_SIZE]:
+            embed.add_field(
+                name=entry.name,
+                value=f"Joined <t:{int(entry.joined_at)}:R>",
+                inline=False
             )
+        if page_count > 1:
+            embed.set_footer(text=f"Page {page}/{page_count}")
+        pages.append(embed)
+
+    playerlist_cache[server.name] = (roster, (roster.version, server.capacity), pages)
+    return pages
+
+@bot.tree.command(name='playerlist', description='Get the current players on a monitored server!')
+@app_commands.describe(server="The server to list players for. Defaults to the server shown in the bot's status.")
+@app_commands.autocomplete(server=server_autocomplete)
+@app_commands.allowed_installs(guilds=True, users=True)
+async def playerlist(interaction: discord.Interaction, server: Optional[str] = None):
+    monitored = server_registry.get(server)
+    if monitored is None:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+        return
+
+    send = interaction.response.send_message
+    snapshot = monitored.poller.snapshot
+    if snapshot is None or snapshot.age > PLAYER_SNAPSHOT_MAX_AGE:
+        #Servers with a long check interval get a fresh list on demand. The fetch is shared with the scheduled check.
+        await interaction.response.defer()
+        send = interaction.followup.send
+        await check_server_status(monitored, max_age=PLAYER_SNAPSHOT_MAX_AGE)
+
+    if monitored.poller.snapshot is None or monitored.server_was_offline or not monitored.poller.snapshot.online:
+        await send(
+            "Error: cannot fetch player list, please notify <@617462103938302098> that the API is down.",
+            ephemeral=True
+        )
+    else:
+        pages = render_player_pages(monitored)
+        if pages:
+            await send_pages(interaction, pages)
+        else:
+            await send(f'No players are currently online on {monitored.name}.')
+
+
+@bot.tree.command(name='topplaytime', description='Show the players with the most playtime on a server.')
+@app_commands.describe(server="The server to show. Defaults to the server shown in the bot's status.", count="How many players to show (1-25)")
+@app_commands.autocomplete(server=server_autocomplete)
+@app_commands.allowed_installs(guilds=True, users=True)
+async def topplaytime(interaction: discord.Interaction, server: Optional[str] = None, count: app_commands.Range[int, 1, 25] = 10):
+    monitored = server_registry.get(server)
+    if monitored is None:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+        return
+
+    leaders = await session_store.top_playtime(monitored, count)
+    if not leaders:
+        await interaction.response.send_message(f"No playtime has been recorded on {monitored.name} yet.")
+        return
+
+    embed = discord.Embed(title=f"Top Playtime on {monitored.name}", color=discord.Color.green())
+    for rank, (player, seconds) in enumerate(leaders, 1):
+        embed.add_field(name=f"#{rank} {player}", value=seconds_to_hours_and_minutes(seconds), inline=False)
+    await interaction.response.send_message(embed=embed)
+
+
+@bot.tree.command(name='playerhistory', description="Show a player's recent sessions on a server.")
+@app_commands.describe(player="The player's name", server="The server to show. Defaults to the server shown in the bot's status.", count="How many sessions to show (1-25)")
+@app_commands.autocomplete(server=server_autocomplete)
+@app_commands.allowed_installs(guilds=True, users=True)
+async def playerhistory(interaction: discord.Interaction, player: str, server: Optional[str] = None, count: app_commands.Range[int, 1, 25] = 10):
+    monitored = server_registry.get(server)
+    if monitored is None:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+        return
+
+    sessions = await session_store.player_history(monitored, player, count)
+    if not sessions:
+        await interaction.response.send_message(f"No sessions have been recorded for {player} on {monitored.name}.")
+        return
+
+    embed = discord.Embed(title=f"Recent Sessions of {player} on {monitored.name}", color=discord.Color.green())
+    for start, end in sessions:
+        embed.add_field(name=f"<t:{int(start)}:f>", value=f"Played for {seconds_to_hours_and_minutes(end - start)}", inline=False)
+    await interaction.response.send_message(embed=embed)
+
+
+@bot.tree.command(name='peakhours', description='Show the busiest hours of the day on a server.')
+@app_commands.describe(server="The server to show. Defaults to the server shown in the bot's status.")
+@app_commands.autocomplete(server=server_autocomplete)
+@app_commands.allowed_installs(guilds=True, users=True)
+async def peakhours(interaction: discord.Interaction, server: Optional[str] = None):
+    monitored = server_registry.get(server)
+    if monitored is None:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+        return
+
+    hours = await session_store.peak_hours(monitored)
+    if not hours:
+        await interaction.response.send_message(f"No playtime has been recorded on {monitored.name} yet.")
+        return
+
+    busiest = max(hours.values())
+    lines = []
+    for hour in range(24):
+        seconds = hours.get(hour, 0)
+        bar = '\u2588' * round(seconds / busiest * 20)
+        lines.append(f"{hour:02d}:00 {bar} {seconds_to_hours_and_minutes(seconds)}")
+    embed = discord.Embed(
+        title=f"Peak Hours on {monitored.name}",
+        description="Total player time spent in each hour of the day:\n```\n" + '\n'.join(lines) + "\n```",
+        color=discord.Color.green()
+    )
+    await interaction.response.send_message(embed=embed)
+
+
+GRAPH_WINDOWS = {
+    '1h': (3600, 'seconds'),
+    '24h': (86400, 'minutes'),
+    '7d': (7 * 86400, 'hours'),
+    '30d': (30 * 86400, 'hours'),
+}
+graph_cache = {}
+
+def render_player_graph(title, points, capacity):
+    #Runs in a worker thread. Figure is used directly instead of pyplot so no global state is shared between threads.
+    figure = Figure(figsize=(10, 4), dpi=100)
+    axes = figure.subplots()
+    times = [datetime.fromtimestamp(timestamp, utc_minus_5) for timestamp, _, _ in points]
+    axes.fill_between(times, [peak for _, _, peak in points], step='post', alpha=0.25, color='tab:green', label='Peak')
+    axes.step(times, [average for _, average, _ in points], where='post', color='tab:green', label='Average')
+    axes.set_ylim(0, max(capacity, max(peak for _, _, peak in points)) + 1)
+    axes.set_title(title)
+    axes.set_ylabel('Players')
+    axes.grid(alpha=0.3)
+    axes.legend(loc='upper left')
+    axes.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d %H:%M', tz=utc_minus_5))
+    figure.autofmt_xdate()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+@bot.tree.command(name='playergraph', description='Show a graph of the player count on a server.')
+@app_commands.describe(server="The server to show. Defaults to the server shown in the bot's status.", window="How far back the graph goes")
+@app_commands.choices(window=[app_commands.Choice(name=name, value=name) for name in GRAPH_WINDOWS])
+@app_commands.autocomplete(server=server_autocomplete)
+@app_commands.allowed_installs(guilds=True, users=True)
+async def playergraph(interaction: discord.Interaction, server: Optional[str] = None, window: str = '24h'):
+    if Figure is None:
+        await interaction.response.send_message("Graphs aren't available, matplotlib isn't installed.", ephemeral=True)
+        return
+    monitored = server_registry.get(server)
+    if monitored is None:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+        return
+
+    seconds, resolution = GRAPH_WINDOWS[window]
+    series = getattr(monitored.player_counts, resolution)
+    #The raw samples change every check, so the 1h graph is only redrawn once a new minute rollup lands.
+    version = monitored.player_counts.minutes.version if resolution == 'seconds' else series.version
+    cache_key = (monitored.name, window)
+    cached = graph_cache.get(cache_key)
+    if cached and cached[0] == (version, monitored.capacity):
+        png = cached[1]
+    else:
+        now = time.time()
+        points = series.window(now - seconds, now)
+        if not points:
+            await interaction.response.send_message(f"Not enough player count history for {monitored.name} yet.", ephemeral=True)
+            return
+        await interaction.response.defer()
+        png = await asyncio.to_thread(render_player_graph, f"Players on {monitored.name} (last {window})", points, monitored.capacity)
+        graph_cache[cache_key] = ((version, monitored.capacity), png)
+
+    file = discord.File(io.BytesIO(png), filename='players.png')
+    embed = discord.Embed(title=f"Players on {monitored.name} (last {window})", color=discord.Color.green())
+    embed.set_image(url='attachment://players.png')
+    if interaction.response.is_done():
+        await interaction.followup.send(embed=embed, file=file)
+    else:
+        await interaction.response.send_message(embed=embed, file=file)
 
 
 @bot.tree.command(name="ping", description="Check the bot's latency and response time.")
@@ -263,7 +2162,11 @@ async def info(interaction: discord.Interaction):
         "You can use various commands to interact with me and get information.\n"
         "Available commands are:\n"
         "/help : Shows this command\n"
-        "/playerlist : Lists all the players in NA1\n"
+        "/playerlist : Lists all the players on a monitored server\n"
+        "/servers : Lists the servers the bot is monitoring\n"
+        "/topplaytime : Players with the most playtime\n"
+        "/playerhistory : A player's recent sessions\n"
+        "/peakhours : The busiest hours of the day\n"
         "/ping : Bot ping\n"
         "/source : Bot source code\n"
         "/orecalc : Ore calculator spreadsheet \n"
@@ -272,10 +2175,46 @@ async def info(interaction: discord.Interaction):
         "/versioninfo : View latest changes."
         "/playerleavenotification : Get notified when a player leaves the server."
         '/stopplayerleavenotification : Stop getting notified when a player leaves the server.'
+        "\n/watch : Get notified about specific players or servers. /unwatch and /watches manage them."
+        "\n/setlogchannel : Send join/leave and server status updates to this channel. /removelogchannel turns them off."
+        "\n/playergraph : A graph of a server's player count"
+        "\n/setsuggestionstatus : Mark a suggestion as planned, done or rejected. (Only Mr. Baguetter can run this)"
     )
     await interaction.response.send_message(f"Bot Info:\n{bot_description}")
 
 
+def format_latency(histogram):
+    count, average, p95, maximum = histogram.summary()
+    if not count:
+        return "No samples yet"
+    return f"{count} samples | avg {average * 1000:.1f}ms | p95 <= {p95 * 1000:.0f}ms | max {maximum * 1000:.1f}ms"
+
+@bot.tree.command(name='stats', description="Show the bot's performance stats. (Only Mr. Baguetter can run this)")
+@app_commands.allowed_installs(guilds=True, users=True)
+async def stats(interaction: discord.Interaction):
+    if interaction.user.id != allowed_user_id:
+        await interaction.response.send_message("You don't have permission to view the stats.", ephemeral=True)
+        return
+
+    embed = discord.Embed(title="Bot Stats", color=discord.Color.gold())
+    embed.add_field(name="Upstream fetches", value=format_latency(upstream_fetch_seconds), inline=False)
+    embed.add_field(name="Redis commands", value=format_latency(redis_command_seconds), inline=False)
+    embed.add_field(name="Discord sends", value=format_latency(discord_send_seconds), inline=False)
+    embed.add_field(name="Presence updates", value=format_latency(presence_update_seconds), inline=False)
+    embed.add_field(name="Server check duration", value=format_latency(poll_duration_seconds), inline=False)
+    embed.add_field(name="Server check lag", value=f"{format_latency(poll_lag_seconds)} | {poll_overruns_total.total} overruns", inline=False)
+    embed.add_field(name="Event loop lag", value=format_latency(event_loop_lag_seconds), inline=False)
+    messages_sent = notification_messages_total.values.get((('result', 'ok'),), 0)
+    embed.add_field(
+        name="Notification queue",
+        value=f"{notification_dispatcher.depth} queued | oldest {notification_dispatcher.oldest_wait:.1f}s | {notifications_total.total} queued in total, sent in {messages_sent} messages | last batch waited {notification_dispatcher.last_batch_wait:.1f}s",
+        inline=False
+    )
+    cache_hits = cache_requests_total.values.get((('result', 'hit'),), 0)
+    embed.add_field(name="Redis cache", value=f"{cache_hits}/{cache_requests_total.total} reads served from memory", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 @bot.tree.command(name='source', description='Get the link to the GitHub repository.')
 @app_commands.allowed_installs(guilds=True, users=True)
 async def link(interaction: discord.Interaction):
@@ -295,43 +2234,153 @@ async def restartbot(interaction: discord.Interaction):
     if interaction.user.id == allowed_user_id:
         await interaction.response.send_message('Restarting the bot...')
         print('Restart command issued.')
+        bot.restart_requested = True
         await bot.close()
-        os.execv(sys.executable, ['python', BOT_PATH])
     else:
         await interaction.response.send_message("You don't have permission to restart the bot.")
 
+SUGGESTION_STATUSES = ('open', 'planned', 'done', 'rejected')
+
+
+class SuggestionStore:
+    #Suggestions as records in Redis, indexed by id so /showsuggestions only ever reads one page:
+    #  suggestion:<id>             hash   text, author_id, created_at, status, digest
+    #  suggestions                 zset   every id scored by id
+    #  suggestions:<status>        zset   ids with that status scored by id
+    #  suggestion_digests          hash   digest of the normalized text -> id, for duplicates
+    #  suggestion_rate:<user id>   zset   submission times, for the rate limit
+    @staticmethod
+    def digest(text):
+        return hashlib.sha1(' '.join(text.lower().split()).encode('utf-8')).hexdigest()
+
+    def _index_key(self, status=None):
+        return f"suggestions:{status}" if status else "suggestions"
+
+    async def add(self, author_id, text, now=None):
+        #Returns (id, None) when stored, otherwise (existing id or None, reason).
+        now = now if now is not None else time.time()
+        rate_key = f"suggestion_rate:{author_id}"
+        await redis_client.zremrangebyscore(rate_key, 0, now - SUGGESTION_RATE_PERIOD)
+        if await redis_client.zcard(rate_key) >= SUGGESTION_RATE_LIMIT:
+            return None, 'rate_limited'
+
+        digest = self.digest(text)
+        existing = await redis_client.hget("suggestion_digests", digest)
+        if existing is not None:
+            return int(existing), 'duplicate'
+
+        suggestion_id = await redis_client.incr("suggestion_next_id")
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hset(f"suggestion:{suggestion_id}", mapping={'text': text, 'author_id': str(author_id), 'created_at': now, 'status': 'open', 'digest': digest})
+        pipe.zadd(self._index_key(), {suggestion_id: suggestion_id})
+        pipe.zadd(self._index_key('open'), {suggestion_id: suggestion_id})
+        pipe.hset("suggestion_digests", digest, suggestion_id)
+        pipe.zadd(rate_key, {f"{now}:{suggestion_id}": now})
+        pipe.expire(rate_key, SUGGESTION_RATE_PERIOD)
+        with redis_command_seconds.time(command='pipeline'):
+            await pipe.execute()
+        return suggestion_id, None
+
+    async def page(self, status=None, cursor=None, count=SUGGESTION_PAGE_SIZE):
+        #Newest first. cursor is the last id of the previous page, the returned cursor is None when nothing is left.
+        upper = f"({cursor}" if cursor is not None else '+inf'
+        ids = await redis_client.zrevrangebyscore(self._index_key(status), upper, '-inf', start=0, num=count + 1)
+        pipe = redis_client.pipeline(transaction=False)
+        for suggestion_id in ids[:count]:
+            pipe.hgetall(f"suggestion:{suggestion_id}")
+        with redis_command_seconds.time(command='pipeline'):
+            records = await pipe.execute() if ids else []
+        suggestions = [(int(suggestion_id), record) for suggestion_id, record in zip(ids, records) if record]
+        next_cursor = int(ids[count - 1]) if len(ids) > count else None
+        return suggestions, next_cursor
+
+    async def count(self, status=None):
+        return await redis_client.zcard(self._index_key(status))
+
+    async def set_status(self, suggestion_id, status):
+        old_status = await redis_client.hget(f"suggestion:{suggestion_id}", 'status')
+        if old_status is None:
+            return None
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hset(f"suggestion:{suggestion_id}", 'status', status)
+        pipe.zrem(self._index_key(old_status), suggestion_id)
+        pipe.zadd(self._index_key(status), {suggestion_id: suggestion_id})
+        await pipe.execute()
+        return old_status
+
+    async def migrate_legacy(self):
+        #Suggestions used to be plain strings in the suggestions_list list, with no author or time.
+        legacy = await redis_client.lrange("suggestions_list", 0, -1)
+        if not legacy:
+            return
+        for text in legacy:
+            await self.add(0, text)
+            await redis_client.delete("suggestion_rate:0")
+        await redis_client.delete("suggestions_list")
+        print(f"Moved {len(legacy)} suggestions to the suggestion store.")
+
+
+suggestion_store = SuggestionStore()
+
 @bot.tree.command(name='suggestion', description='Submit a suggestion.')
 @app_commands.describe(suggestion="Your suggestion for the bot.")
-async def suggestion(interaction: discord.Interaction, suggestion: str):
-    suggestions_key = "suggestions_list"
-    redis_client.rpush(suggestions_key, suggestion)
-    await interaction.response.send_message(f"Thank you for your suggestion! Your idea has been submitted.")
+async def suggestion(interaction: discord.Interaction, suggestion: app_commands.Range[str, 1, SUGGESTION_MAX_LENGTH]):
+    suggestion_id, reason = await suggestion_store.add(interaction.user.id, suggestion)
+    if reason == 'rate_limited':
+        await interaction.response.send_message(f"You can only submit {SUGGESTION_RATE_LIMIT} suggestions per hour, please try again later.", ephemeral=True)
+    elif reason == 'duplicate':
+        await interaction.response.send_message(f"That has already been suggested (suggestion #{suggestion_id}). Thanks anyway!", ephemeral=True)
+    else:
+        await interaction.response.send_message("Thank you for your suggestion! Your idea has been submitted.")
 
 
+async def render_suggestion_page(status, cursor=None):
+    suggestions, next_cursor = await suggestion_store.page(status, cursor)
+    embed = discord.Embed(
+        title=f"{status.capitalize()} Suggestions" if status else "Suggestions",
+        description=f"{await suggestion_store.count(status)} in total, newest first:",
+        color=discord.Color.green()
+    )
+    for suggestion_id, record in suggestions:
+        author = f"<@{record['author_id']}>" if record['author_id'] != '0' else "unknown"
+        embed.add_field(
+            name=f"Suggestion #{suggestion_id} ({record['status']})",
+            value=f"{record['text'][:SUGGESTION_MAX_LENGTH]}\nby {author} <t:{int(float(record['created_at']))}:R>"[:1024],
+            inline=False
+        )
+    return embed, next_cursor
+
 @bot.tree.command(name='showsuggestions', description='Show all suggestions.')
+@app_commands.describe(status="Only show suggestions with this status. Defaults to open ones.")
+@app_commands.choices(status=[app_commands.Choice(name=status.capitalize(), value=status) for status in SUGGESTION_STATUSES] + [app_commands.Choice(name="All", value='all')])
 @app_commands.allowed_installs(guilds=True, users=True)
-async def showsuggestions(interaction: discord.Interaction):
+async def showsuggestions(interaction: discord.Interaction, status: str = 'open'):
     if interaction.user.id == allowed_user_id:
-        suggestions_key = "suggestions_list"
-        suggestions = redis_client.lrange(suggestions_key, 0, -1)
-        if suggestions:
-            embed = discord.Embed(
-                title="Suggestions",
-                description="Here are the suggestions submitted:",
-                color=discord.Color.green()
-            )
-            for idx, suggestion in enumerate(suggestions, 1):
-                embed.add_field(
-                    name=f"Suggestion #{idx}",
-                    value=suggestion.decode('utf-8'),
-                    inline=False
-                )
+        status = None if status == 'all' else status
+        embed, next_cursor = await render_suggestion_page(status)
+        if not embed.fields:
+            await interaction.response.send_message("No suggestions found.")
+        elif next_cursor is None:
             await interaction.response.send_message(embed=embed)
         else:
-            await interaction.response.send_message("No suggestions found.")
+            await interaction.response.send_message(embed=embed, view=LazyPaginatorView(embed, next_cursor, lambda cursor: render_suggestion_page(status, cursor), interaction.user.id))
     else:
         await interaction.response.send_message("You do not have permission to view suggestions.")
 
+@bot.tree.command(name='setsuggestionstatus', description='Mark a suggestion as planned, done or rejected.')
+@app_commands.describe(suggestion_id="The suggestion number shown by /showsuggestions", status="The new status")
+@app_commands.choices(status=[app_commands.Choice(name=status.capitalize(), value=status) for status in SUGGESTION_STATUSES])
+@app_commands.allowed_installs(guilds=True, users=True)
+async def setsuggestionstatus(interaction: discord.Interaction, suggestion_id: int, status: str):
+    if interaction.user.id != allowed_user_id:
+        await interaction.response.send_message("You do not have permission to change suggestions.", ephemeral=True)
+        return
+    old_status = await suggestion_store.set_status(suggestion_id, status)
+    if old_status is None:
+        await interaction.response.send_message(f"Suggestion #{suggestion_id} doesn't exist.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"Suggestion #{suggestion_id} changed from {old_status} to {status}.", ephemeral=True)
+
 @bot.tree.command(name='changelog', description='Bot changelog')
 @app_commands.allowed_installs(guilds=True, users=True)
 async def changelog(interaction: discord.Interaction):
@@ -404,57 +2453,200 @@ async def versioninfo(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="playerleavenotification", description="Subscribe to notifications when a player leaves.")
+@app_commands.guild_only()
 async def playerleavenotification(interaction: discord.Interaction):
-    user_id = str(interaction.user.id)
-    notifications_key = "leave_notifications"
+    watch = Watch(interaction.user.id, 'leave', guild_id=interaction.guild_id)
 
-    if redis_client.sismember(notifications_key, user_id):
+    if watch.id in watch_index.watches:
         await interaction.response.send_message("You are already subscribed to player leave notifications.", ephemeral=True)
     else:
-        redis_client.sadd(notifications_key, user_id)
+        await watch_index.add(watch)
         await interaction.response.send_message("You have successfully subscribed to player leave notifications.", ephemeral=True)
 
 @bot.tree.command(name="stopplayerleavenotification", description="Unsubscribe from notifications when a player leaves.")
+@app_commands.guild_only()
 async def stopplayerleavenotification(interaction: discord.Interaction):
-    user_id = str(interaction.user.id)
-    notifications_key = "leave_notifications"
+    watch = Watch(interaction.user.id, 'leave', guild_id=interaction.guild_id)
 
-    if redis_client.sismember(notifications_key, user_id):
-        redis_client.srem(notifications_key, user_id)
+    if await watch_index.remove(watch.id):
         await interaction.response.send_message("You have successfully unsubscribed from player leave notifications.", ephemeral=True)
     else:
         await interaction.response.send_message("You are not subscribed to player leave notifications.", ephemeral=True)
 
-@bot.tree.command(name="serverset", description="Set the server IP address and port")
-@app_commands.describe(ip="The IP address to set for the server", port="The port number to set for the server (1-65535)")
-async def serverset(interaction: discord.Interaction, ip: str, port: int):
-    if not re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", ip):
-        await interaction.response.send_message("Invalid IP format. Please use a valid IP address.", ephemeral=True)
+@bot.tree.command(name="watch", description="Get notified when a player joins or leaves, or when a server goes offline or comes back.")
+@app_commands.describe(
+    event="What to be notified about",
+    player="Only for this player. Leave empty for every player.",
+    server="Only for this server. Leave empty for every server.",
+    delivery="Get a DM, or a mention in this server's log channel"
+)
+@app_commands.choices(
+    event=[app_commands.Choice(name=f"When {description}", value=event) for event, description in WATCH_EVENTS.items()],
+    delivery=[app_commands.Choice(name="Mention", value='mention'), app_commands.Choice(name="DM", value='dm')]
+)
+@app_commands.autocomplete(server=server_autocomplete)
+@app_commands.allowed_installs(guilds=True, users=True)
+async def watch(interaction: discord.Interaction, event: str, player: Optional[str] = None, server: Optional[str] = None, delivery: Optional[str] = None):
+    if server is not None and server not in server_registry.servers:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+        return
+    if delivery is None:
+        delivery = 'mention' if interaction.guild_id else 'dm'
+    if delivery == 'mention' and not interaction.guild_id:
+        await interaction.response.send_message("Mentions only work inside a server, use DM delivery instead.", ephemeral=True)
         return
+    if player and event not in ('join', 'leave'):
+        player = None
+
+    new_watch = Watch(interaction.user.id, event, server or '*', player or '*', delivery, interaction.guild_id if delivery == 'mention' else None)
+    await watch_index.add(new_watch)
+    await interaction.response.send_message(f"You will be notified when {new_watch.describe()}.", ephemeral=True)
+
+async def user_watch_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=user_watch.describe().replace('**', '')[:100], value=user_watch.id)
+        for user_watch in watch_index.for_user(interaction.user.id)
+        if current.lower() in user_watch.describe().lower()
+    ][:25]
+
+@bot.tree.command(name="unwatch", description="Stop one of your notifications.")
+@app_commands.describe(watch="The notification to stop")
+@app_commands.autocomplete(watch=user_watch_autocomplete)
+@app_commands.allowed_installs(guilds=True, users=True)
+async def unwatch(interaction: discord.Interaction, watch: str):
+    existing = watch_index.watches.get(watch)
+    if existing is None or existing.user_id != str(interaction.user.id):
+        await interaction.response.send_message("You don't have that notification.", ephemeral=True)
+        return
+    await watch_index.remove(watch)
+    await interaction.response.send_message(f"You will no longer be notified when {existing.describe()}.", ephemeral=True)
+
+@bot.tree.command(name="watches", description="List your notifications.")
+@app_commands.allowed_installs(guilds=True, users=True)
+async def watches(interaction: discord.Interaction):
+    user_watches = watch_index.for_user(interaction.user.id)
+    if not user_watches:
+        await interaction.response.send_message("You don't have any notifications. Use /watch to add one.", ephemeral=True)
+        return
+    lines = [f"- {user_watch.describe()}" for user_watch in user_watches]
+    await interaction.response.send_message("You will be notified when:\n" + '\n'.join(lines)[:1900], ephemeral=True)
 
+def validate_server_address(ip, port):
+    if not re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", ip):
+        return "Invalid IP format. Please use a valid IP address."
     if not (0 < port < 65536):
-        await interaction.response.send_message("Invalid port. Please provide a valid port number between 1 and 65535.", ephemeral=True)
+        return "Invalid port. Please provide a valid port number between 1 and 65535."
+    return None
+
+@bot.tree.command(name="serverset", description="Set the server IP address and port")
+@app_commands.describe(ip="The IP address to set for the server", port="The port number to set for the server (1-65535)", server="The monitored server to change. Defaults to the server shown in the bot's status.")
+@app_commands.autocomplete(server=server_autocomplete)
+async def serverset(interaction: discord.Interaction, ip: str, port: int, server: Optional[str] = None):
+    if interaction.user.id != allowed_user_id:
+        await interaction.response.send_message("You don't have permission to change servers.", ephemeral=True)
+        return
+
+    error = validate_server_address(ip, port)
+    if error:
+        await interaction.response.send_message(error, ephemeral=True)
+        return
+
+    monitored = server_registry.get(server)
+    if monitored is None:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
         return
 
     try:
-        with open(EXPRESS_SERVER_PATH, 'r') as file:
-            content = file.read()
+        monitored.host, monitored.port = ip, port
+        await server_registry.save(monitored)
+        await interaction.response.send_message(f"{monitored.name} IP and port successfully updated to: {ip}:{port}.", ephemeral=True)
 
-        content = re.sub(r"host: '.*?'", f"host: '{ip}'", content)
-        content = re.sub(r"port: \d+", f"port: {port}", content)
+    except Exception as e:
+        await interaction.response.send_message(f"Error updating server settings: {e}", ephemeral=True)
 
-        with open(EXPRESS_SERVER_PATH, 'w') as file:
-            file.write(content)
+@bot.tree.command(name="serveradd", description="Start monitoring another server. (Only Mr. Baguetter can run this)")
+@app_commands.describe(
+    name="A name for the server",
+    ip="The IP address of the server",
+    port="The Steam query port of the server (1-65535)",
+    capacity="The server's player slots. Read from the server when left empty.",
+    channel="The channel join/leave logs for this server go to. Defaults to the log channel.",
+    interval="How often (in seconds) to check the server"
+)
+async def serveradd(interaction: discord.Interaction, name: str, ip: str, port: int, capacity: Optional[int] = None, channel: Optional[discord.TextChannel] = None, interval: int = CHECK_INTERVAL):
+    if interaction.user.id != allowed_user_id:
+        await interaction.response.send_message("You don't have permission to add servers.", ephemeral=True)
+        return
 
-        if hasattr(bot, 'node_process') and bot.node_process:
-            bot.node_process.terminate()
-            bot.node_process.wait()
+    error = validate_server_address(ip, port)
+    if error:
+        await interaction.response.send_message(error, ephemeral=True)
+        return
 
-        bot.node_process = subprocess.Popen(['node', EXPRESS_SERVER_PATH], cwd=os.path.dirname(EXPRESS_SERVER_PATH))
+    if name in server_registry.servers:
+        await interaction.response.send_message(f"{name} is already being monitored.", ephemeral=True)
+        return
 
-        await interaction.response.send_message(f"Server IP and port successfully updated to: {ip}:{port}. Node.js server restarted.", ephemeral=True)
+    await interaction.response.defer(ephemeral=True)
+    if capacity is None:
+        capacity = await query_capacity(ip, port)
+    server = MonitoredServer(name, ip, port, max(capacity, 1), channel.id if channel else None, max(interval, 1))
+    await server_registry.save(server)
+    presence_updater.refresh()
+    await interaction.followup.send(f"Now monitoring {name} ({ip}:{port}, {server.capacity} slots).", ephemeral=True)
+
+@bot.tree.command(name="serverremove", description="Stop monitoring a server. (Only Mr. Baguetter can run this)")
+@app_commands.describe(server="The server to stop monitoring")
+@app_commands.autocomplete(server=server_autocomplete)
+async def serverremove(interaction: discord.Interaction, server: str):
+    if interaction.user.id != allowed_user_id:
+        await interaction.response.send_message("You don't have permission to remove servers.", ephemeral=True)
+        return
 
-    except Exception as e:
-        await interaction.response.send_message(f"Error updating server settings: {e}", ephemeral=True)
+    if await server_registry.remove(server) is None:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+    else:
+        playerlist_cache.pop(server, None)
+        await redis_client.delete(server_log_channels_key(server))
+        presence_updater.refresh()
+        await interaction.response.send_message(f"Stopped monitoring {server}.", ephemeral=True)
+
+@bot.tree.command(name="servers", description="List the servers the bot is monitoring.")
+@app_commands.allowed_installs(guilds=True, users=True)
+async def servers(interaction: discord.Interaction):
+    if not server_registry.servers:
+        await interaction.response.send_message("No servers are being monitored.")
+        return
+
+    embed = discord.Embed(title="Monitored Servers", color=discord.Color.green())
+    for server in list(server_registry.servers.values())[:25]:
+        snapshot = server.poller.snapshot
+        if snapshot is None:
+            status = "Not checked yet"
+        elif snapshot.online:
+            status = f"{len(snapshot.players)}/{server.capacity} players online"
+        else:
+            status = "Offline"
+        embed.add_field(name=server.name, value=f"{server.host}:{server.port} - {status}", inline=False)
+    await interaction.response.send_message(embed=embed)
 
-bot.run(TOKEN)
+@bot.tree.command(name="setpresenceserver", description="Choose which server the bot's status shows. (Only Mr. Baguetter can run this)")
+@app_commands.describe(server="The server to show in the bot's status")
+@app_commands.autocomplete(server=server_autocomplete)
+async def setpresenceserver(interaction: discord.Interaction, server: str):
+    if interaction.user.id != allowed_user_id:
+        await interaction.response.send_message("You don't have permission to change the status server.", ephemeral=True)
+        return
+
+    if server not in server_registry.servers:
+        await interaction.response.send_message(f"Unknown server: {server}", ephemeral=True)
+        return
+
+    await server_registry.set_presence_server(server)
+    presence_updater.refresh()
+    await interaction.response.send_message(f"The bot's status now shows {server}.", ephemeral=True)
+
+if __name__ == '__main__': #benchmark.py imports this file without starting the bot.
+    bot.run(TOKEN)
+    if bot.restart_requested:
+        os.execv(sys.executable, ['python', BOT_PATH])
@@ -0,0 +1,404 @@
+#Replays player list traces through check_server_status and the notification pipeline and reports how long
+#each check took, how many notifications went out, how much memory grew and how long the event loop was blocked.
+#Everything runs locally: a fake /players server, fakeredis and a stubbed Discord channel. pip install fakeredis
+#
+#  python benchmark.py                                  run every built in scenario
+#  python benchmark.py --scenario large_server          run one of them
+#  python benchmark.py --trace players.jsonl            replay a recorded trace, one /players response per line (null when it failed)
+#  python benchmark.py --output results.json            save the results
+#  python benchmark.py --baseline results.json          exit with 1 if anything got slower than the saved results
+#
+#fakeredis runs inside the event loop, so Redis time also counts as loop blocking here. tracemalloc slows every
+#tick down, compare results taken with the same flags or use --no-tracemalloc for latency only runs.
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('REDIS_HOST', 'localhost')
+os.environ.setdefault('REDIS_PORT', '6379')
+os.environ.setdefault('REDIS_DB', '0')
+os.environ['QUERY_BACKEND'] = 'express'
+
+from aiohttp import web
+import redis.asyncio as aioredis
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeConnection
+
+import SEBot
+
+LOOP_SAMPLE_INTERVAL = 0.005 #How often (in seconds) the event loop blocking sampler wakes up.
+GUILDS = 3 #Log channels that receive every notification, like the bot being in a few servers.
+#Metric -> smallest absolute change that counts as a regression. Max values are single samples and too noisy to
+#compare, so only percentiles are checked. The floors keep scheduler jitter on fast runs from failing the check.
+REGRESSION_METRICS = {'tick_p95_ms': 5, 'tick_p99_ms': 5, 'loop_blocked_p99_ms': 5, 'memory_growth_kb': 256}
+
+
+def player_name(number):
+    return f"Player{number:05d}"
+
+
+class SyntheticTrace:
+    #Builds the list /players returns on every tick. joined_at maps each online player's number to the tick they joined.
+    def __init__(self, rng, interval):
+        self.rng = rng
+        self.interval = interval
+        self.joined_at = {}
+        self.next_player = 0
+
+    def join(self, count, tick):
+        for _ in range(count):
+            self.joined_at[self.next_player] = tick
+            self.next_player += 1
+
+    def leave(self, count):
+        for number in self.rng.sample(sorted(self.joined_at), min(count, len(self.joined_at))):
+            del self.joined_at[number]
+
+    def churn(self, count, tick):
+        self.leave(count)
+        self.join(count, tick)
+
+    def frame(self, tick):
+        return [{'name': player_name(number), 'raw': {'time': (tick - joined) * self.interval}} for number, joined in self.joined_at.items()]
+
+
+def steady_churn(rng, ticks, players, interval):
+    trace = SyntheticTrace(rng, interval)
+    trace.join(players, 0)
+    for tick in range(ticks):
+        trace.churn(max(1, players // 50), tick)
+        yield trace.frame(tick)
+
+
+def large_server(rng, ticks, players, interval):
+    trace = SyntheticTrace(rng, interval)
+    trace.join(players, 0)
+    for tick in range(ticks):
+        trace.churn(max(1, players // 20), tick)
+        yield trace.frame(tick)
+
+
+def mass_restart(rng, ticks, players, interval):
+    #Full server, the API goes away for a while, then everyone joins again at once. Repeats until the ticks run out.
+    trace = SyntheticTrace(rng, interval)
+    trace.join(players, 0)
+    for tick in range(ticks):
+        phase = tick % 40
+        if phase < 20:
+            yield trace.frame(tick)
+        elif phase < 30:
+            if trace.joined_at:
+                trace.leave(len(trace.joined_at))
+            yield None
+        else:
+            if not trace.joined_at:
+                trace.join(players, tick)
+            yield trace.frame(tick)
+
+
+def flapping_api(rng, ticks, players, interval):
+    #The API fails for a few checks in a row, often enough to trip the circuit breaker, then recovers.
+    trace = SyntheticTrace(rng, interval)
+    trace.join(players, 0)
+    for tick in range(ticks):
+        if tick % 8 < 4:
+            yield None
+        else:
+            trace.churn(rng.randint(0, 3), tick)
+            yield trace.frame(tick)
+
+
+SCENARIOS = {
+    'steady_churn': (steady_churn, 300, 200),
+    'large_server': (large_server, 200, 1000),
+    'mass_restart': (mass_restart, 120, 1000),
+    'flapping_api': (flapping_api, 200, 100),
+}
+
+
+def recorded_trace(path):
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+class FakePlayersServer:
+    #Stands in for server.js. Serves whatever frame the benchmark set last, or a 503 when the frame is None.
+    def __init__(self):
+        self.frame = []
+        self.runner = None
+        self.url = None
+
+    async def players(self, request):
+        if self.frame is None:
+            return web.json_response({'error': 'Failed to fetch players'}, status=503)
+        return web.json_response(self.frame)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/players', self.players)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}/players'
+
+    async def close(self):
+        await self.runner.cleanup()
+
+
+class FakeChannel:
+    #The Discord transport. Sends take send_latency seconds and are only counted.
+    def __init__(self, channel_id, send_latency):
+        self.id = channel_id
+        self.send_latency = send_latency
+        self.messages = 0
+        self.characters = 0
+
+    async def send(self, content):
+        await asyncio.sleep(self.send_latency)
+        self.messages += 1
+        self.characters += len(content)
+
+
+class LoopBlockingSampler:
+    #Sleeps for a short interval and records how late it woke up. A late wakeup means something held the loop.
+    def __init__(self, interval=LOOP_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def reset_metrics():
+    for metric in SEBot.metrics.metrics:
+        if hasattr(metric, 'values'):
+            metric.values.clear()
+
+
+async def setup_state(args, fake_server):
+    #Fresh Redis, dispatcher and watches for every scenario so one run can't warm up the next.
+    pool = aioredis.ConnectionPool(connection_class=FakeConnection, server=FakeServer(), decode_responses=True)
+    SEBot.redis_client = SEBot.InstrumentedRedis(connection_pool=pool)
+    SEBot.redis_cache = SEBot.RedisCache(SEBot.redis_client)
+    SEBot.notification_dispatcher = SEBot.NotificationDispatcher(window=args.batch_window, channel_interval=0)
+    SEBot.watch_index = SEBot.WatchIndex()
+    SEBot.watch_notifier = SEBot.WatchNotifier()
+    SEBot.sidecar.ready.set()
+    SEBot.backoff_delay = lambda attempt: 0 #Random retry backoff would make runs with the same --seed differ.
+
+    channels = {}
+    for guild in range(GUILDS):
+        channel = FakeChannel(1000 + guild, args.send_latency)
+        channels[channel.id] = channel
+        await SEBot.redis_client.hset(SEBot.log_channels_key, str(guild + 1), channel.id)
+    SEBot.bot.get_channel = channels.get
+
+    rng = random.Random(args.seed)
+    for user in range(args.watches):
+        await SEBot.watch_index.add(SEBot.Watch(10000 + user, rng.choice(('join', 'leave')), player=player_name(rng.randrange(args.players or 1000)), guild_id=rng.randint(1, GUILDS)))
+
+    server = SEBot.MonitoredServer('Benchmark', '127.0.0.1', 27016, capacity=args.players or 1000, interval=0)
+    server.poller.backends = [SEBot.ExpressBackend(server, fake_server.url)]
+    server.poller.breaker.reset_timeout = 0 #Ticks are replayed back to back, so let the breaker retry on the next one.
+    return server, channels
+
+
+async def run_scenario(name, frames, args, fake_server):
+    reset_metrics()
+    server, channels = await setup_state(args, fake_server)
+    events = {'joined': 0, 'left': 0, 'offline': 0, 'online': 0}
+    counters = {
+        'notify_player_joined': 'joined',
+        'notify_player_left': 'left',
+        'notify_server_offline': 'offline',
+        'notify_server_online': 'online',
+    }
+    originals = {function: getattr(SEBot, function) for function in counters}
+
+    def counting(function, event):
+        async def wrapper(*args, **kwargs):
+            events[event] += 1
+            return await function(*args, **kwargs)
+        return wrapper
+
+    for function, event in counters.items():
+        setattr(SEBot, function, counting(originals[function], event))
+
+    sampler = LoopBlockingSampler()
+    tick_times = []
+    if args.tracemalloc:
+        tracemalloc.start()
+    memory_start = tracemalloc.get_traced_memory()[0]
+    SEBot.notification_dispatcher.start()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        for frame in frames:
+            fake_server.frame = frame
+            tick_start = time.perf_counter()
+            await SEBot.check_server_status(server)
+            tick_times.append(time.perf_counter() - tick_start)
+            if args.tick_interval:
+                await asyncio.sleep(args.tick_interval)
+            else:
+                await asyncio.sleep(0)
+        ticks_done = time.perf_counter()
+        await SEBot.notification_dispatcher.close()
+        await SEBot.watch_notifier.close()
+        elapsed = time.perf_counter() - start
+    finally:
+        for function, original in originals.items():
+            setattr(SEBot, function, original)
+        await sampler.close()
+        memory_end, memory_peak = tracemalloc.get_traced_memory()
+        if args.tracemalloc:
+            tracemalloc.stop()
+        await SEBot.redis_client.aclose()
+
+    messages = sum(channel.messages for channel in channels.values())
+    redis_count, redis_avg, _, _ = SEBot.redis_command_seconds.summary()
+    return {
+        'scenario': name,
+        'ticks': len(tick_times),
+        'tick_mean_ms': sum(tick_times) / len(tick_times) * 1000 if tick_times else 0,
+        'tick_p50_ms': percentile(tick_times, 0.5) * 1000,
+        'tick_p95_ms': percentile(tick_times, 0.95) * 1000,
+        'tick_p99_ms': percentile(tick_times, 0.99) * 1000,
+        'tick_max_ms': max(tick_times, default=0) * 1000,
+        'ticks_per_second': len(tick_times) / (ticks_done - start) if ticks_done > start else 0,
+        'events': events,
+        'notifications_queued': SEBot.notifications_total.total,
+        'messages_sent': messages,
+        'message_characters': sum(channel.characters for channel in channels.values()),
+        'notifications_per_second': SEBot.notifications_total.total / elapsed if elapsed else 0,
+        'messages_per_second': messages / elapsed if elapsed else 0,
+        'redis_commands': redis_count,
+        'redis_mean_ms': redis_avg * 1000,
+        'memory_start_kb': memory_start / 1024 if args.tracemalloc else None,
+        'memory_end_kb': memory_end / 1024 if args.tracemalloc else None,
+        'memory_peak_kb': memory_peak / 1024 if args.tracemalloc else None,
+        'memory_growth_kb': (memory_end - memory_start) / 1024 if args.tracemalloc else None,
+        'loop_blocked_max_ms': max(sampler.lags, default=0) * 1000,
+        'loop_blocked_p99_ms': percentile(sampler.lags, 0.99) * 1000,
+        'loop_blocked_total_ms': sum(sampler.lags) * 1000,
+        'elapsed_seconds': elapsed,
+    }
+
+
+def compare(results, baseline, tolerance):
+    #A metric regressed when it is more than tolerance and more than its floor worse than the baseline.
+    previous = {result['scenario']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(result['scenario'])
+        if old is None:
+            continue
+        for metric, floor in REGRESSION_METRICS.items():
+            if old.get(metric) is None or result[metric] is None:
+                continue
+            if result[metric] > max(old[metric] * (1 + tolerance), old[metric] + floor):
+                regressions.append({'scenario': result['scenario'], 'metric': metric, 'baseline': old[metric], 'current': result[metric]})
+    return regressions
+
+
+async def main(args):
+    if args.trace:
+        scenarios = [(os.path.basename(args.trace), recorded_trace(args.trace))]
+    else:
+        rng = random.Random(args.seed)
+        names = args.scenario or list(SCENARIOS)
+        scenarios = []
+        for name in names:
+            generate, ticks, players = SCENARIOS[name]
+            scenarios.append((name, generate(rng, args.ticks or ticks, args.players or players, SEBot.CHECK_INTERVAL)))
+
+    fake_server = FakePlayersServer()
+    await fake_server.start()
+    results = []
+    #The bot logs with print, keep that out of the JSON on stdout.
+    bot_log = open(os.devnull, 'w') if args.quiet else sys.stderr
+    try:
+        for name, frames in scenarios:
+            with contextlib.redirect_stdout(bot_log):
+                result = await run_scenario(name, frames, args, fake_server)
+            results.append(result)
+            memory = f"memory +{result['memory_growth_kb']:.0f}KB, " if args.tracemalloc else ''
+            print(f"{name}: {result['ticks']} ticks, p95 {result['tick_p95_ms']:.2f}ms, max {result['tick_max_ms']:.2f}ms, "
+                  f"{result['notifications_per_second']:.0f} notifications/s, {memory}"
+                  f"loop blocked max {result['loop_blocked_max_ms']:.2f}ms", file=sys.stderr)
+    finally:
+        if args.quiet:
+            bot_log.close()
+        await fake_server.close()
+        await SEBot.http_client.close()
+
+    output = {
+        'bot_version': SEBot.BOT_VERSION,
+        'python': sys.version.split()[0],
+        'timestamp': time.time(),
+        'settings': {'seed': args.seed, 'send_latency': args.send_latency, 'batch_window': args.batch_window, 'watches': args.watches, 'tick_interval': args.tick_interval, 'tracemalloc': args.tracemalloc},
+        'results': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as file:
+            output['regressions'] = compare(results, json.load(file), args.tolerance)
+        for regression in output['regressions']:
+            print(f"Regression in {regression['scenario']}: {regression['metric']} {regression['baseline']:.2f} -> {regression['current']:.2f}", file=sys.stderr)
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    return 1 if output.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the polling and notification pipeline.")
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help="Run only this scenario. Can be repeated.")
+    parser.add_argument('--trace', help="Replay a recorded trace instead of the built in scenarios.")
+    parser.add_argument('--ticks', type=int, help="Override the number of checks per scenario.")
+    parser.add_argument('--players', type=int, help="Override the number of players per scenario.")
+    parser.add_argument('--watches', type=int, default=500, help="Random per player watches to match against.")
+    parser.add_argument('--send-latency', type=float, default=0.02, help="Seconds each stubbed Discord send takes.")
+    parser.add_argument('--batch-window', type=float, default=0.05, help="Notification batch window in seconds.")
+    parser.add_argument('--tick-interval', type=float, default=0, help="Seconds between checks. 0 replays as fast as possible.")
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false', help="Skip memory tracking, it slows every tick down.")
+    parser.add_argument('--quiet', action='store_true', help="Hide the bot's own log output.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the JSON results here instead of stdout.")
+    parser.add_argument('--baseline', help="Earlier JSON results to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="How much worse (0.25 = 25%%) a metric can get before it counts as a regression.")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,18 +1,24 @@
 const express = require('express');
 const Gamedig = require('gamedig');
-const cors = require('cors');
 
 const app = express();
-const port = 3000;
+const port = process.env.PORT || 3000;
+// Only the bot on this machine talks to the sidecar, it must not be reachable as a query proxy from outside.
+const bindHost = '127.0.0.1';
+const defaultHost = process.env.SE_SERVER_HOST || '192.169.93.178';
+const defaultPort = parseInt(process.env.SE_SERVER_PORT, 10) || 27019;
 
-app.use(cors());
+app.get('/health', (req, res) => {
+    res.json({ status: 'ok' });
+});
 
 app.get('/players', async (req, res) => {
     try {
+        // The bot passes the server to query as ?host=&port= so one sidecar can serve every monitored server.
         const state = await Gamedig.query({
             type: 'spaceengineers',
-            host: '192.169.93.178', 
-            port: 27019             
+            host: req.query.host || defaultHost,
+            port: parseInt(req.query.port, 10) || defaultPort
         });
 
         if (state && state.players) {
@@ -26,6 +32,6 @@ app.get('/players', async (req, res) => {
     }
 });
 
-app.listen(port, () => {
-    console.log(`Server running on port ${port}`);
+app.listen(port, bindHost, () => {
+    console.log(`Server running on ${bindHost}:${port}`);
 });
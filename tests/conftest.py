@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('REDIS_HOST', 'localhost')
+os.environ.setdefault('REDIS_PORT', '6379')
+os.environ.setdefault('REDIS_DB', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SEBot
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    #A fresh in-memory Redis per test, swapped in for the bot's client.
+    client = FakeRedis(server=FakeServer(), decode_responses=True)
+    monkeypatch.setattr(SEBot, 'redis_client', client)
+    return client
@@ -0,0 +1,145 @@
+import asyncio
+import struct
+
+import pytest
+
+import SEBot
+
+HEADER = SEBot.A2S_HEADER
+CHALLENGE = b'wxyz'
+INFO = b'I\x11Keen NA1\x00Map\x00SpaceEngineers\x00Space Engineers\x00' + struct.pack('<hBBB', 244, 5, 16, 0)
+
+
+def players_payload(players):
+    payload = b'D' + bytes([len(players) % 256])
+    for index, (name, duration) in enumerate(players):
+        payload += bytes([index % 256]) + name.encode('utf-8') + b'\x00' + struct.pack('<lf', 0, duration)
+    return payload
+
+
+def split_packets(payload, parts, numbers=None):
+    size = -(-len(payload) // parts)
+    chunks = [payload[index:index + size] for index in range(0, len(payload), size)]
+    numbers = numbers or range(len(chunks))
+    return [SEBot.A2S_SPLIT_HEADER + struct.pack('<LBBH', 7, len(chunks), number, 1248) + chunk for number, chunk in zip(numbers, chunks)]
+
+
+class FakeA2SServer(asyncio.DatagramProtocol):
+    #Answers A2S_PLAYER with a challenge first, then with whatever reply() returns for the challenged request.
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests.append(data)
+        if data == SEBot.A2S_INFO_REQUEST:
+            self.transport.sendto(HEADER + INFO, addr)
+        elif data == SEBot.A2S_PLAYER_REQUEST + HEADER:
+            self.transport.sendto(HEADER + b'A' + CHALLENGE, addr)
+        elif data == SEBot.A2S_PLAYER_REQUEST + CHALLENGE:
+            for packet in self.reply():
+                self.transport.sendto(packet, addr)
+
+
+async def start_server(reply):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(lambda: FakeA2SServer(reply), local_addr=('127.0.0.1', 0))
+    return server, transport.get_extra_info('sockname')[1]
+
+
+def query(reply):
+    async def run():
+        server, port = await start_server(reply)
+        client = SEBot.A2SClient(timeout=0.5)
+        try:
+            return await client.query_players('127.0.0.1', port), server
+        finally:
+            client.close()
+            server.transport.close()
+    return asyncio.run(run())
+
+
+def test_parse_players():
+    players = SEBot.parse_a2s_players(players_payload([('Alice', 12.5), ('Bob', 3600)])[1:])
+    assert players == [{'name': 'Alice', 'raw': {'score': 0, 'time': 12.5}}, {'name': 'Bob', 'raw': {'score': 0, 'time': 3600}}]
+
+
+def test_parse_info():
+    info = SEBot.parse_a2s_info(INFO[1:])
+    assert (info['name'], info['players'], info['max_players']) == ('Keen NA1', 5, 16)
+
+
+def test_query_capacity(monkeypatch):
+    async def run():
+        server, port = await start_server(lambda: [])
+        monkeypatch.setattr(SEBot, 'a2s_client', SEBot.A2SClient(timeout=0.2))
+        try:
+            assert await SEBot.query_capacity('127.0.0.1', port) == 16
+            server.transport.close()
+            monkeypatch.setattr(SEBot, 'SE_SERVER_CAPACITY', 40)
+            assert await SEBot.query_capacity('127.0.0.1', port) == 40 #No answer, falls back to the default.
+        finally:
+            SEBot.a2s_client.close()
+            server.transport.close()
+    asyncio.run(run())
+
+
+def test_challenge_flow():
+    players, server = query(lambda: [HEADER + players_payload([('Alice', 10)])])
+    assert [player['name'] for player in players] == ['Alice']
+    assert server.requests == [SEBot.A2S_PLAYER_REQUEST + HEADER, SEBot.A2S_PLAYER_REQUEST + CHALLENGE]
+
+
+def test_split_response_out_of_order():
+    names = [(f"Player{number}", number) for number in range(100)]
+    packets = split_packets(HEADER + players_payload(names), 3)
+    players, _ = query(lambda: list(reversed(packets)))
+    assert [player['name'] for player in players] == [name for name, _ in names]
+
+
+@pytest.mark.parametrize('reply', [
+    lambda: [HEADER + players_payload([('Alice', 10)])[:-3]],
+    lambda: [HEADER + b'D\x01\x00Alice'],
+    lambda: split_packets(HEADER + players_payload([('Alice', 10)] * 20), 2, numbers=[0, 5]),
+    lambda: [HEADER + b'X'],
+])
+def test_malformed_reply_is_an_a2s_error(reply):
+    with pytest.raises(SEBot.A2SError):
+        query(reply)
+
+
+class StaticBackend:
+    name = 'express'
+
+    def __init__(self, players):
+        self.players = players
+
+    async def fetch_players(self):
+        return self.players
+
+
+def test_malformed_reply_falls_back_and_counts_as_failure(monkeypatch):
+    monkeypatch.setattr(SEBot, 'A2S_MAX_RETRIES', 0)
+
+    async def run():
+        server, port = await start_server(lambda: [HEADER + players_payload([('Alice', 10)])[:-3]])
+        client = SEBot.A2SClient(timeout=0.5)
+        monkeypatch.setattr(SEBot, 'a2s_client', client)
+        monitored = SEBot.MonitoredServer('Test', '127.0.0.1', port)
+        try:
+            monitored.poller.backends = [SEBot.A2SBackend(monitored)]
+            snapshot = await monitored.poller.get(max_age=0)
+            assert snapshot.players is None
+            assert monitored.poller.breaker.failures == 1
+
+            monitored.poller.backends = [SEBot.A2SBackend(monitored), StaticBackend([{'name': 'Bob'}])]
+            snapshot = await monitored.poller.get(max_age=0)
+            assert snapshot.players == [{'name': 'Bob'}]
+        finally:
+            client.close()
+            server.transport.close()
+    asyncio.run(run())
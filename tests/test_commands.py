@@ -0,0 +1,108 @@
+import asyncio
+
+import SEBot
+
+
+class FakeResponse:
+    def __init__(self, sent):
+        self.sent = sent
+        self.deferred = False
+
+    def is_done(self):
+        return self.deferred or bool(self.sent)
+
+    async def defer(self, **kwargs):
+        self.deferred = True
+
+    async def send_message(self, content=None, **kwargs):
+        self.sent.append(('response', content, kwargs))
+
+
+class FakeFollowup:
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(('followup', content, kwargs))
+
+
+class FakeInteraction:
+    def __init__(self, user_id=1):
+        self.sent = []
+        self.user = type('User', (), {'id': user_id})()
+        self.guild_id = None
+        self.response = FakeResponse(self.sent)
+        self.followup = FakeFollowup(self.sent)
+
+
+class StaticBackend:
+    name = 'express'
+
+    def __init__(self, players):
+        self.players = players
+        self.fetches = 0
+
+    async def fetch_players(self):
+        self.fetches += 1
+        return self.players
+
+
+def test_playerlist_refreshes_a_stale_roster(fake_redis, monkeypatch):
+    async def run():
+        server = SEBot.MonitoredServer('Slow', '127.0.0.1', 27016, interval=300)
+        backend = StaticBackend([{'name': 'Alice', 'raw': {'time': 60}}])
+        server.poller.backends = [backend]
+        monkeypatch.setattr(SEBot.server_registry, 'servers', {'Slow': server})
+        monkeypatch.setattr(SEBot, 'notify_player_joined', lambda *args: asyncio.sleep(0))
+
+        await SEBot.check_server_status(server)
+        server.poller.snapshot.fetched_at -= 200 #The scheduled check is still 100s away.
+        backend.players = [{'name': 'Alice', 'raw': {'time': 260}}, {'name': 'Bob', 'raw': {'time': 5}}]
+
+        interaction = FakeInteraction()
+        await SEBot.playerlist.callback(interaction, 'Slow')
+        assert backend.fetches == 2
+        assert interaction.response.deferred
+        (kind, _, kwargs), = interaction.sent
+        assert kind == 'followup'
+        assert [field.name for field in kwargs['embed'].fields] == ['Alice', 'Bob']
+
+        interaction = FakeInteraction()
+        await SEBot.playerlist.callback(interaction, 'Slow')
+        assert backend.fetches == 2 #Fresh enough, answered from the roster without deferring.
+        assert interaction.sent[0][0] == 'response'
+    asyncio.run(run())
+
+
+def test_guild_remove_survives_server_removal(fake_redis, monkeypatch):
+    async def run():
+        servers = {name: SEBot.MonitoredServer(name, '127.0.0.1', 27016) for name in ('A', 'B')}
+        monkeypatch.setattr(SEBot.server_registry, 'servers', servers)
+        monkeypatch.setattr(SEBot, 'redis_cache', SEBot.RedisCache(fake_redis))
+        hdel = SEBot.redis_cache.hdel
+
+        async def hdel_and_remove(key, field):
+            if key == SEBot.server_log_channels_key('A'):
+                servers.pop('B', None) #A concurrent /serverremove.
+            return await hdel(key, field)
+        monkeypatch.setattr(SEBot.redis_cache, 'hdel', hdel_and_remove)
+
+        await SEBot.on_guild_remove(type('Guild', (), {'id': 42})())
+    asyncio.run(run())
+
+
+def test_only_the_command_user_can_turn_lazy_pages():
+    async def run():
+        fetches = []
+
+        async def fetch(cursor):
+            fetches.append(cursor)
+            return SEBot.discord.Embed(title='Page 2'), None
+        view = SEBot.LazyPaginatorView(SEBot.discord.Embed(title='Page 1'), 'cursor', fetch, SEBot.allowed_user_id)
+
+        stranger = FakeInteraction(user_id=1)
+        assert not await view.interaction_check(stranger)
+        assert stranger.sent[0][2] == {'ephemeral': True}
+        assert await view.interaction_check(FakeInteraction(user_id=SEBot.allowed_user_id))
+        assert fetches == []
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+import asyncio
+
+import SEBot
+
+
+class FakeChannel:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.messages = []
+
+    async def send(self, content):
+        await asyncio.sleep(self.delay)
+        self.messages.append(content)
+
+
+def test_batches_lines_and_mentions(monkeypatch):
+    async def run():
+        channel = FakeChannel()
+        monkeypatch.setattr(SEBot.bot, 'get_channel', lambda channel_id: channel)
+        dispatcher = SEBot.NotificationDispatcher(window=0, channel_interval=0)
+        dispatcher.enqueue(1, "a joined")
+        dispatcher.enqueue(1, "b left", ('7',))
+        dispatcher.enqueue(1, '', ('7', '8'))
+        await dispatcher.flush()
+        assert channel.messages == ["a joined\nb left\n<@7> <@8>"]
+    asyncio.run(run())
+
+
+def test_close_during_flush_keeps_the_batch(monkeypatch):
+    async def run():
+        channel = FakeChannel(delay=0.05)
+        monkeypatch.setattr(SEBot.bot, 'get_channel', lambda channel_id: channel)
+        dispatcher = SEBot.NotificationDispatcher(window=0, channel_interval=0)
+        dispatcher.start()
+        dispatcher.enqueue(1, "first")
+        await asyncio.sleep(0.02) #The worker has taken "first" off the queue and is sending it.
+        assert dispatcher.depth == 0
+        dispatcher.enqueue(1, "second")
+        await dispatcher.close()
+        assert channel.messages == ["first", "second"]
+    asyncio.run(run())
+
+
+def test_worker_survives_send_errors(monkeypatch):
+    async def run():
+        class FlakyChannel(FakeChannel):
+            async def send(self, content):
+                if not self.messages and content == "first":
+                    self.messages.append(None)
+                    raise ConnectionResetError("Connection reset by peer")
+                await super().send(content)
+
+        channel = FlakyChannel()
+        monkeypatch.setattr(SEBot.bot, 'get_channel', lambda channel_id: channel)
+        dispatcher = SEBot.NotificationDispatcher(window=0, channel_interval=0)
+        dispatcher.start()
+        dispatcher.enqueue(1, "first")
+        await asyncio.sleep(0.02)
+        assert not dispatcher.worker.done()
+
+        #Errors outside the send itself don't stop the worker either.
+        monkeypatch.setattr(SEBot.bot, 'get_channel', lambda channel_id: 1 / 0)
+        dispatcher.enqueue(1, "lost")
+        await asyncio.sleep(0.02)
+        assert not dispatcher.worker.done()
+
+        monkeypatch.setattr(SEBot.bot, 'get_channel', lambda channel_id: channel)
+        dispatcher.enqueue(1, "second")
+        await asyncio.sleep(0.02)
+        assert channel.messages == [None, "second"]
+        await dispatcher.close()
+    asyncio.run(run())
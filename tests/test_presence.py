@@ -0,0 +1,27 @@
+import asyncio
+import types
+
+import discord
+
+import SEBot
+
+
+def test_status_update_retried_after_connection_closed(monkeypatch):
+    async def run():
+        calls = []
+
+        async def change_presence(status=None, activity=None):
+            calls.append(activity.name)
+            if len(calls) == 1:
+                raise discord.ConnectionClosed(types.SimpleNamespace(close_code=1006), shard_id=0)
+        monkeypatch.setattr(SEBot.bot, 'change_presence', change_presence)
+        monkeypatch.setattr(SEBot.server_registry, 'servers', {})
+
+        updater = SEBot.PresenceUpdater(debounce=0.01, refresh_interval=0)
+        updater.start()
+        await asyncio.sleep(0.1)
+        assert not updater.task.done()
+        assert calls == ["No servers are being monitored"] * 2
+        assert updater.current == updater.desired
+        await updater.close()
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+import asyncio
+
+import SEBot
+
+
+def test_hit_after_write_through(fake_redis):
+    async def run():
+        cache = SEBot.RedisCache(fake_redis)
+        assert await cache.hgetall('log_channels') == {}
+        await cache.hset('log_channels', '1', 100)
+        assert await fake_redis.hget('log_channels', '1') == '100'
+
+        await fake_redis.hset('log_channels', '2', 200) #Not seen by the cache until it expires or is invalidated.
+        before = SEBot.cache_requests_total.values.get((('result', 'hit'),), 0)
+        assert await cache.hgetall('log_channels') == {'1': '100'}
+        assert SEBot.cache_requests_total.values[(('result', 'hit'),)] == before + 1
+
+        await cache.hdel('log_channels', '1')
+        assert await cache.hgetall('log_channels') == {}
+        assert await fake_redis.hexists('log_channels', '1') == 0
+    asyncio.run(run())
+
+
+def test_keyspace_message_invalidates(fake_redis, monkeypatch):
+    async def run():
+        cache = SEBot.RedisCache(fake_redis, ttl=3600)
+
+        async def enabled():
+            return True
+        monkeypatch.setattr(cache, '_enable_notifications', enabled)
+        cache.start()
+        for _ in range(50):
+            if cache.notifications:
+                break
+            await asyncio.sleep(0.01)
+        assert cache.notifications
+
+        await cache.hset('log_channels', '1', 100)
+        assert await cache.hgetall('log_channels') == {'1': '100'}
+        await fake_redis.hset('log_channels', '1', 200)
+        assert await cache.hgetall('log_channels') == {'1': '100'}
+
+        #fakeredis doesn't send keyspace notifications itself, so publish the ones Redis would send.
+        assert await fake_redis.publish(f"__keyspace@{SEBot.REDIS_DB}__:player_counts:Keen NA1", 'hset') == 0
+        await fake_redis.publish(f"__keyspace@{SEBot.REDIS_DB}__:log_channels", 'hset')
+        for _ in range(50):
+            if 'log_channels' not in cache._values:
+                break
+            await asyncio.sleep(0.01)
+        assert await cache.hgetall('log_channels') == {'1': '200'}
+        await cache.close()
+    asyncio.run(run())
+
+
+def test_ttl_fallback_when_config_is_refused(fake_redis, monkeypatch):
+    async def run():
+        async def refused(*args, **kwargs):
+            raise SEBot.redis.ResponseError("unknown command 'config'")
+        monkeypatch.setattr(fake_redis, 'config_get', refused)
+
+        cache = SEBot.RedisCache(fake_redis, ttl=60)
+        await cache.listen()
+        assert not cache.notifications
+
+        clock = [1000.0]
+        monkeypatch.setattr(SEBot.time, 'monotonic', lambda: clock[0])
+        await fake_redis.hset('log_channels', '1', 100)
+        assert await cache.hgetall('log_channels') == {'1': '100'}
+        await fake_redis.hset('log_channels', '1', 200)
+        clock[0] += 59
+        assert await cache.hgetall('log_channels') == {'1': '100'}
+        clock[0] += 2
+        assert await cache.hgetall('log_channels') == {'1': '200'}
+    asyncio.run(run())
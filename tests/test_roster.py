@@ -0,0 +1,91 @@
+import asyncio
+
+import SEBot
+
+
+def players(*entries):
+    return [{'name': name, 'raw': {'time': seconds}} for name, seconds in entries]
+
+
+def test_duplicate_names_are_tracked_separately():
+    roster = SEBot.RosterTracker(leave_misses=1)
+    joined, left = roster.update(players(('Engineer', 100), ('Engineer', 5)), 1000)
+    assert len(joined) == 2 and not left
+    assert sorted(entry.joined_at for entry in joined) == [900, 995]
+
+    joined, left = roster.update(players(('Engineer', 110)), 1010)
+    assert not joined
+    assert [entry.joined_at for entry in left] == [995] #The newer one left, the one online since 900 stays.
+    assert [entry.joined_at for entry in roster.entries.values()] == [900]
+
+
+def test_leave_needs_n_misses():
+    roster = SEBot.RosterTracker(leave_misses=3)
+    roster.update(players(('Alice', 10)), 1000)
+    for now in (1002, 1004):
+        assert roster.update([], now) == ([], [])
+    joined, left = roster.update(players(('Alice', 16)), 1006) #Back before the third miss, same session.
+    assert not joined and not left
+
+    for now in (1008, 1010):
+        roster.update([], now)
+    joined, left = roster.update([], 1012)
+    assert [entry.name for entry in left] == ['Alice']
+    assert left[0].last_seen == 1006
+    assert len(roster) == 0
+
+
+def test_rejoin_detected_by_time_on_server():
+    roster = SEBot.RosterTracker()
+    first, _ = roster.update(players(('Alice', 500)), 1000)
+    joined, left = roster.update(players(('Alice', 3)), 1002)
+    assert left == first
+    assert [entry.joined_at for entry in joined] == [999]
+
+    #Small jitter in the reported time isn't a rejoin.
+    joined, left = roster.update(players(('Alice', 5 - SEBot.ROSTER_REJOIN_TOLERANCE + 1)), 1004)
+    assert not joined and not left
+
+
+def test_restore_after_restart_keeps_playtime(fake_redis):
+    async def run():
+        server = SEBot.MonitoredServer('Test', '127.0.0.1', 27016)
+        joined, _ = server.roster.update(players(('Alice', 0)), 1000)
+        await SEBot.session_store.record(server, joined)
+        server.roster.update(players(('Alice', 4000)), 5000)
+        await SEBot.session_store.save_open(server)
+
+        #The bot restarts and Alice left while it was down.
+        restarted = SEBot.MonitoredServer('Test', '127.0.0.1', 27016)
+        restarted.roster.load(await SEBot.session_store.open_sessions(restarted))
+        assert [(entry.name, entry.joined_at, entry.last_seen) for entry in restarted.roster.entries.values()] == [('Alice', 1000, 5000)]
+
+        left = []
+        for now in range(6000, 6000 + 2 * SEBot.ROSTER_LEAVE_MISSES, 2):
+            left += restarted.roster.update([], now)[1]
+        await SEBot.session_store.record(restarted, left=[(entry, entry.last_seen) for entry in left])
+        assert await SEBot.session_store.top_playtime(restarted, 1) == [('Alice', 4000.0)]
+        assert await SEBot.session_store.player_history(restarted, 'Alice', 1) == [(1000.0, 5000.0)]
+        assert await fake_redis.hlen("open_sessions:Test") == 0
+    asyncio.run(run())
+
+
+def test_check_saves_last_seen_periodically(fake_redis, monkeypatch):
+    async def run():
+        server = SEBot.MonitoredServer('Test', '127.0.0.1', 27016)
+        snapshots = iter([players(('Alice', 0)), players(('Alice', 40))])
+        clock = [1000.0]
+
+        async def get(max_age=None):
+            server.poller.version += 1
+            return SEBot.PlayerSnapshot(next(snapshots), 0, server.poller.version)
+        monkeypatch.setattr(server.poller, 'get', get)
+        monkeypatch.setattr(SEBot.time, 'time', lambda: clock[0])
+        monkeypatch.setattr(SEBot, 'notify_player_joined', lambda *args: asyncio.sleep(0))
+
+        await SEBot.check_server_status(server)
+        clock[0] += SEBot.ROSTER_SAVE_INTERVAL + 10
+        await SEBot.check_server_status(server)
+        saved = list((await SEBot.session_store.open_sessions(server)).values())
+        assert [entry.last_seen for entry in saved] == [clock[0]]
+    asyncio.run(run())
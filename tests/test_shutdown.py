@@ -0,0 +1,96 @@
+import asyncio
+
+import SEBot
+
+
+def test_player_count_saver_close_survives_redis_errors(monkeypatch):
+    async def run():
+        class Unreachable:
+            def pipeline(self, transaction=True):
+                raise SEBot.redis.ConnectionError("Connection refused")
+        monkeypatch.setattr(SEBot, 'redis_client', Unreachable())
+        registry = SEBot.ServerRegistry()
+        registry.servers['Test'] = SEBot.MonitoredServer('Test', '127.0.0.1', 27016)
+        saver = SEBot.PlayerCountSaver(registry)
+        saver.start()
+        await saver.close()
+        assert saver.task is None
+    asyncio.run(run())
+
+
+def test_bot_close_runs_every_step_when_redis_is_down(monkeypatch):
+    async def run():
+        class Unreachable:
+            def pipeline(self, transaction=True):
+                raise SEBot.redis.ConnectionError("Connection refused")
+
+            async def hset(self, *args, **kwargs):
+                raise SEBot.redis.ConnectionError("Connection refused")
+
+            async def aclose(self):
+                raise SEBot.redis.ConnectionError("Connection refused")
+
+        closed = []
+
+        async def sidecar_close():
+            closed.append('sidecar')
+
+        async def http_close():
+            closed.append('http')
+
+        async def client_close(self):
+            closed.append('client')
+
+        monkeypatch.setattr(SEBot, 'redis_client', Unreachable())
+        monkeypatch.setattr(SEBot.sidecar, 'close', sidecar_close)
+        monkeypatch.setattr(SEBot.http_client, 'close', http_close)
+        monkeypatch.setattr(SEBot.commands.AutoShardedBot, 'close', client_close)
+        server = SEBot.MonitoredServer('Test', '127.0.0.1', 27016)
+        server.roster.update([{'name': 'Alice', 'raw': {'time': 5}}], 1000)
+        monkeypatch.setitem(SEBot.server_registry.servers, 'Test', server)
+        SEBot.player_count_saver.start()
+
+        bot = SEBot.SpaceEngineersBot(command_prefix='/', intents=SEBot.intents)
+        await bot.close()
+        assert closed == ['sidecar', 'http', 'client']
+    asyncio.run(run())
+
+
+def test_player_count_saver_only_writes_changed_rings(fake_redis):
+    async def run():
+        registry = SEBot.ServerRegistry()
+        server = SEBot.MonitoredServer('Test', '127.0.0.1', 27016)
+        registry.servers['Test'] = server
+        saver = SEBot.PlayerCountSaver(registry)
+        writes = []
+        pipeline = fake_redis.pipeline
+
+        def recording_pipeline(**kwargs):
+            pipe = pipeline(**kwargs)
+            hset = pipe.hset
+
+            def recording_hset(name, mapping=None):
+                writes.append(sorted(mapping))
+                return hset(name, mapping=mapping)
+            pipe.hset = recording_hset
+            return pipe
+        fake_redis.pipeline = recording_pipeline
+
+        await saver.save()
+        assert writes == [] #Nothing recorded yet.
+
+        server.player_counts.record(3600, 4)
+        await saver.save()
+        assert writes == [['seconds']]
+
+        server.player_counts.record(3661, 5) #Rolls the first minute up.
+        await saver.save()
+        assert writes[-1] == ['minutes', 'seconds']
+
+        await saver.save()
+        assert len(writes) == 2
+
+        restored = SEBot.PlayerCountSeries()
+        restored.load(await fake_redis.hgetall('player_counts:Test'))
+        assert restored.minutes.window(3600, 3600) == [(3600, 4.0, 4)]
+    asyncio.run(run())